@@ -0,0 +1,50 @@
+# ------------------------------------------------------------------------------- #
+# haversine_benchmark.py - Compares the scalar haversine with the vectorized      #
+#                          kernels over all pairs of towers of a tower file       #
+# ------------------------------------------------------------------------------- #
+
+import os, sys, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy
+from celltowers.containment import load_towers
+from celltowers.distance import haversine, haversine_many, haversine_blocks
+
+def help():
+	print('Use: ' + sys.argv[0] + ' [tower_file]')
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+TOWERS_FILE          = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ivorycoast', 'ivorycoast_towers.csv')
+REPEAT               = 3
+
+# ------------------------------------------------------------------------------- #
+# Script begins                                                                   #
+# ------------------------------------------------------------------------------- #
+if len(sys.argv) > 2:
+	help()
+	exit(1)
+file = open(sys.argv[1] if len(sys.argv) == 2 else TOWERS_FILE, 'rt')
+towers = load_towers(file)
+file.close()
+points = list(towers.values())
+lons = numpy.array([ point[0] for point in points ])
+lats = numpy.array([ point[1] for point in points ])
+pairs = len(points) * len(points)
+print(str(len(points)) + ' towers, ' + str(pairs) + ' pairs')
+
+def scalar():
+	return [ [ haversine([p, q]) for q in points ] for p in points ]
+
+def oneToMany():
+	return [ haversine_many(p[0], p[1], lons, lats) for p in points ]
+
+def blocked():
+	return [ d for firstRow, d in haversine_blocks(lons, lats, lons, lats) ]
+
+expected = numpy.array(scalar())
+print('Max difference, one-to-many: ' + str(numpy.abs(numpy.array(oneToMany()) - expected).max()) + ' km')
+print('Max difference, blocked: ' + str(numpy.abs(numpy.vstack(blocked()) - expected).max()) + ' km')
+for name, kernel in [ ('scalar', scalar), ('one-to-many', oneToMany), ('blocked', blocked) ]:
+	seconds = min(timeit.repeat(kernel, number=1, repeat=REPEAT))
+	print(str.format('{0:<12} {1:8.4f} s {2:12.0f} pairs/s', name, seconds, pairs / seconds))
@@ -0,0 +1,273 @@
+# ------------------------------------------------------------------------------- #
+# pipeline_benchmark.py - Times each stage of the pipeline (grid read and         #
+#                         masking, tessellation, clustering, estimation) on       #
+#                         synthetic grids, geometries and tower sets of           #
+#                         configurable size and on the abidjan/ and ivorycoast/   #
+#                         reference cases; throughput and peak RSS go to a JSON   #
+#                         results file                                            #
+# ------------------------------------------------------------------------------- #
+
+import json, math, os, platform, subprocess, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy, shapely
+import scipy.spatial # imported up front so that the first stage using it is not charged for the import
+from celltowers.containment import TowerIndex, PolygonTree, PopulationTotals, load_towers, load_geometry
+from celltowers.voronoi import tessellate
+from celltowers.scenarios import masked_blocks
+from celltowers.instrumentation import peak_rss
+from celltowers.clustering import dbscan, EPSILON, MIN_POINTS
+from celltowers.cli import parse_options, positive_int, non_empty
+
+def help():
+	print('Use: ' + sys.argv[0] + ' [--sizes=TOWERS:CELLS,...] [--large] [--no-reference] [--work=DIR] [--compare=FILE] [results_file]')
+	print('  --sizes=T:C,...  synthetic cases to run (default ' + ','.join(str(t) + ':' + str(c) for t, c in DEFAULT_SIZES) + ')')
+	print('  --large          also run ' + ','.join(str(t) + ':' + str(c) for t, c in LARGE_SIZES))
+	print('  --no-reference   skip the abidjan and ivorycoast reference cases')
+	print('  --work=DIR       where the generated inputs are kept between runs (default ' + WORK_FOLDER + ')')
+	print('  --compare=FILE   print the change of every stage against an earlier results file')
+	print('  results_file     JSON results (default ' + RESULTS_FILE + ')')
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+ROOT_FOLDER          = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+WORK_FOLDER          = os.path.join(tempfile.gettempdir(), 'cell-tower-benchmark')
+RESULTS_FILE         = 'benchmark_results.json'
+DEFAULT_SIZES        = [ (1000, 10000), (10000, 1000000) ]
+LARGE_SIZES          = [ (100000, 10000000), (1000000, 100000000) ]
+REFERENCE_CASES      = [ 'abidjan', 'ivorycoast' ]
+CELL_SIZE            = 1. / 1200 # 3 arc-seconds, as the Abidjan grid; 100M cells are about the size of Ivory Coast
+REFERENCE_CELL_SIZE  = 1. / 120 # 30 arc-seconds, for the synthetic Ivory Coast grid
+ORIGIN               = (-8.6, 4.3) # lower-left corner of the synthetic grids
+NO_DATA_VALUE        = -9999
+EMPTY_CELLS          = 0.3 # fraction of synthetic cells with no population
+CITIES               = 20 # synthetic towers are half clustered around cities, half uniform
+GEOMETRY_VERTICES    = 64
+GENERATE_ROWS        = 256 # grid rows generated at a time
+SEED                 = 2014
+STAGES               = [ 'grid read and masking', 'tessellation', 'clustering', 'estimation (nearest)', 'estimation (polygons)' ]
+
+# ------------------------------------------------------------------------------- #
+# Stages - accumulates the time spent in, and the items processed by, each stage  #
+# ------------------------------------------------------------------------------- #
+class Stages:
+
+	def __init__(self):
+		self.results = {}
+
+	def add(self, name, seconds, items):
+		stage = self.results.setdefault(name, { 'seconds': 0., 'items': 0 })
+		stage['seconds'] = stage['seconds'] + seconds
+		stage['items'] = stage['items'] + int(items)
+		stage['perSecond'] = stage['items'] / stage['seconds'] if stage['seconds'] > 0 else None
+		stage['peakRss'] = peak_rss()
+
+	# runs compute() as one stage; items(result) is what it processed
+	def run(self, name, compute, items):
+		start = time.perf_counter()
+		result = compute()
+		self.add(name, time.perf_counter() - start, items(result))
+		return result
+
+# ------------------------------------------------------------------------------- #
+# Synthetic inputs, written to folder unless already there                        #
+# a jagged ellipse inside the grid, towers around cities inside its bounds and    #
+# a grid of lognormal populations with EMPTY_CELLS of them zero or no data        #
+# ------------------------------------------------------------------------------- #
+def generate(folder, numTowers, numCells):
+	files = dict((name, os.path.join(folder, name)) for name in ['grid.asc', 'geometry.csv', 'towers.csv'])
+	if all(os.path.exists(path) for path in files.values()):
+		return files
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+	rng = numpy.random.default_rng(SEED)
+	nCols = max(1, int(round(math.sqrt(numCells))))
+	nRows = max(1, numCells // nCols)
+	width, height = nCols * CELL_SIZE, nRows * CELL_SIZE
+	centre = numpy.array([ORIGIN[0] + width / 2, ORIGIN[1] + height / 2])
+	angles = numpy.linspace(0, 2 * math.pi, GEOMETRY_VERTICES, endpoint=False)
+	radii = 0.45 * (1 - 0.2 * rng.random(GEOMETRY_VERTICES))
+	vertices = centre + numpy.column_stack((radii * width * numpy.cos(angles), radii * height * numpy.sin(angles)))
+	with open(files['geometry.csv'], 'wt') as file:
+		file.write(' '.join(str.format('{0:.6f},{1:.6f}', lon, lat) for lon, lat in vertices) + '\n')
+	minLon, minLat = vertices.min(axis=0)
+	maxLon, maxLat = vertices.max(axis=0)
+	cities = numpy.column_stack((rng.uniform(minLon, maxLon, CITIES), rng.uniform(minLat, maxLat, CITIES)))
+	clustered = numTowers // 2
+	near = cities[rng.integers(0, CITIES, clustered)] + rng.normal(0, 0.02, (clustered, 2)) * [width, height]
+	uniform = numpy.column_stack((rng.uniform(minLon, maxLon, numTowers - clustered), rng.uniform(minLat, maxLat, numTowers - clustered)))
+	towers = numpy.vstack((near, uniform)).clip([minLon, minLat], [maxLon, maxLat])
+	with open(files['towers.csv'], 'wt') as file:
+		for i in range(numTowers):
+			file.write(str.format('{0},{1:.6f},{2:.6f}\n', i + 1, towers[i, 0], towers[i, 1]))
+	with open(files['grid.asc'] + '.part', 'wt') as file: # renamed once complete, so an interrupted run is not reused
+		file.write('ncols ' + str(nCols) + '\nnrows ' + str(nRows) + '\nxllcorner ' + repr(ORIGIN[0]) + '\nyllcorner ' + repr(ORIGIN[1]))
+		file.write('\ncellsize ' + repr(CELL_SIZE) + '\nNODATA_value ' + str(NO_DATA_VALUE) + '\n')
+		for firstRow in range(0, nRows, GENERATE_ROWS):
+			rows = min(GENERATE_ROWS, nRows - firstRow)
+			block = rng.lognormal(0, 1.5, (rows, nCols))
+			empty = rng.random((rows, nCols))
+			block[empty < EMPTY_CELLS / 2] = 0
+			block[(empty >= EMPTY_CELLS / 2) & (empty < EMPTY_CELLS)] = NO_DATA_VALUE
+			numpy.savetxt(file, block, fmt='%.2f')
+	os.replace(files['grid.asc'] + '.part', files['grid.asc'])
+	return files
+
+# ------------------------------------------------------------------------------- #
+# Inputs of a reference case: the real towers and geometry; Abidjan comes with    #
+# its converted point file, Ivory Coast has none in the repository, so it gets a  #
+# synthetic grid over the bounds of its geometry                                  #
+# ------------------------------------------------------------------------------- #
+def reference(folder, name):
+	files = { 'towers.csv': os.path.join(ROOT_FOLDER, name, name + '_towers.csv'),
+	          'geometry.csv': os.path.join(ROOT_FOLDER, name, name + '_geometry.csv') }
+	points = os.path.join(ROOT_FOLDER, name, name + '_pop.csv')
+	if os.path.exists(points):
+		files['points.csv'] = points
+		return files
+	with open(files['geometry.csv'], 'rt') as file:
+		minLon, minLat, maxLon, maxLat = load_geometry(file).bounds
+	nCols = int(math.ceil((maxLon - minLon) / REFERENCE_CELL_SIZE))
+	nRows = int(math.ceil((maxLat - minLat) / REFERENCE_CELL_SIZE))
+	path = os.path.join(folder, name + '.asc')
+	if not os.path.exists(path):
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+		rng = numpy.random.default_rng(SEED)
+		with open(path + '.part', 'wt') as file:
+			file.write('ncols ' + str(nCols) + '\nnrows ' + str(nRows) + '\nxllcorner ' + repr(minLon) + '\nyllcorner ' + repr(minLat))
+			file.write('\ncellsize ' + repr(REFERENCE_CELL_SIZE) + '\nNODATA_value ' + str(NO_DATA_VALUE) + '\n')
+			for firstRow in range(0, nRows, GENERATE_ROWS):
+				block = rng.lognormal(0, 1.5, (min(GENERATE_ROWS, nRows - firstRow), nCols))
+				block[rng.random(block.shape) < EMPTY_CELLS] = 0
+				numpy.savetxt(file, block, fmt='%.2f')
+		os.replace(path + '.part', path)
+	files['grid.asc'] = path
+	return files
+
+# ------------------------------------------------------------------------------- #
+# Blocks of the populated points of a case inside its geometry, from the same     #
+# generator as raster_estimator.py and scenario_estimator.py; the time waiting    #
+# for each block, read and masked, goes to the grid stage                         #
+# yields cells, lon, lat, population                                              #
+# ------------------------------------------------------------------------------- #
+def timed_blocks(files, poly, stages):
+	blocks = masked_blocks(files['grid.asc'] if 'grid.asc' in files else files['points.csv'], poly)
+	while True:
+		before = time.perf_counter()
+		try:
+			block = next(blocks)
+		except StopIteration:
+			return
+		stages.add('grid read and masking', time.perf_counter() - before, block[0])
+		yield block
+
+# ------------------------------------------------------------------------------- #
+# Runs every stage of one case in this process; the estimates are summed block by #
+# block as the grid is read, so no more than a block of points is held at a time  #
+# returns { 'towers', 'cells', 'points', 'seconds', 'peakRss', 'stages' }         #
+# ------------------------------------------------------------------------------- #
+def run_case(files):
+	stages = Stages()
+	start = time.perf_counter()
+	with open(files['towers.csv'], 'rt') as file:
+		towers = load_towers(file)
+	with open(files['geometry.csv'], 'rt') as file:
+		poly = load_geometry(file)
+	polygons = stages.run('tessellation', lambda: tessellate(towers, poly), lambda polygons: len(towers))
+	stages.run('clustering', lambda: dbscan(towers, EPSILON, MIN_POINTS), lambda clusters: len(towers))
+	index = stages.run('estimation (nearest)', lambda: TowerIndex(towers), lambda index: 0)
+	tree = stages.run('estimation (polygons)', lambda: PolygonTree(polygons), lambda tree: 0)
+	nearest = PopulationTotals(index.towerIds)
+	inPolygons = PopulationTotals(tree.towerIds)
+	cells = 0
+	points = 0
+	for blockCells, lon, lat, population in timed_blocks(files, poly, stages):
+		stages.run('estimation (nearest)', lambda: nearest.add(index.assign(lon, lat), population), lambda result: len(lon))
+		stages.run('estimation (polygons)', lambda: inPolygons.add(tree.assign(lon, lat), population), lambda result: len(lon))
+		cells = cells + blockCells
+		points = points + len(lon)
+	return { 'towers': len(towers), 'cells': int(cells), 'points': int(points),
+	         'seconds': time.perf_counter() - start, 'peakRss': peak_rss(), 'stages': stages.results }
+
+# ------------------------------------------------------------------------------- #
+# Runs a case in a fresh interpreter, so that its peak RSS is its own             #
+# ------------------------------------------------------------------------------- #
+def run_isolated(name, files):
+	process = subprocess.run([ sys.executable, os.path.abspath(__file__), '--case', json.dumps(files) ],
+	                         stdout=subprocess.PIPE, universal_newlines=True)
+	if process.returncode != 0:
+		print('  failed with exit code ' + str(process.returncode))
+		return { 'name': name, 'error': process.returncode }
+	result = json.loads(process.stdout.strip().splitlines()[-1])
+	result['name'] = name
+	return result
+
+# ------------------------------------------------------------------------------- #
+# Prints the change of every stage against an earlier results file                #
+# ------------------------------------------------------------------------------- #
+def compare(old, new):
+	previous = dict((case['name'], case) for case in old['cases'])
+	print(str.format('{0:<28} {1:<22} {2:>10} {3:>10} {4:>8}', 'case', 'stage', 'before s', 'after s', 'ratio'))
+	for case in new['cases']:
+		if case['name'] not in previous or 'stages' not in case or 'stages' not in previous[case['name']]:
+			continue
+		for stage in STAGES:
+			before = previous[case['name']]['stages'].get(stage)
+			after = case['stages'].get(stage)
+			if before is None or after is None:
+				continue
+			ratio = after['seconds'] / before['seconds'] if before['seconds'] > 0 else float('nan')
+			print(str.format('{0:<28} {1:<22} {2:10.3f} {3:10.3f} {4:8.2f}', case['name'], stage, before['seconds'], after['seconds'], ratio))
+
+# ------------------------------------------------------------------------------- #
+# Command line options; --sizes is TOWERS:CELLS pairs separated by commas         #
+# ------------------------------------------------------------------------------- #
+def case_sizes(value):
+	sizes = [ tuple(positive_int(n) for n in size.split(':')) for size in value.split(',') ]
+	if any(len(size) != 2 for size in sizes):
+		raise ValueError(value)
+	return sizes
+
+FLAGS                = [ '--large', '--no-reference' ]
+VALUES               = { '--sizes': case_sizes, '--work': non_empty, '--compare': non_empty }
+
+# ------------------------------------------------------------------------------- #
+# Script begins                                                                   #
+# ------------------------------------------------------------------------------- #
+if len(sys.argv) == 3 and sys.argv[1] == '--case': # one case, run by run_isolated
+	print(json.dumps(run_case(json.loads(sys.argv[2]))))
+	exit(0)
+options = parse_options([arg for arg in sys.argv[1:] if arg.startswith('--')], FLAGS, VALUES, help)
+sys.argv = [arg for arg in sys.argv if not arg.startswith('--')]
+if len(sys.argv) > 2:
+	help()
+	exit(1)
+resultsFile = sys.argv[1] if len(sys.argv) == 2 else RESULTS_FILE
+sizes = options.get('--sizes', DEFAULT_SIZES) + (LARGE_SIZES if '--large' in options else [])
+references = [] if '--no-reference' in options else REFERENCE_CASES
+work = options.get('--work', WORK_FOLDER)
+compareFile = options.get('--compare')
+
+results = { 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'numpy': numpy.__version__,
+            'shapely': shapely.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count(), 'cases': [] }
+cases = [ (name, lambda name=name: reference(os.path.join(work, 'reference'), name)) for name in references ]
+cases = cases + [ ('synthetic-' + str(t) + '-' + str(c), lambda t=t, c=c: generate(os.path.join(work, str(t) + '-' + str(c)), t, c)) for t, c in sizes ]
+for name, inputs in cases:
+	print('Case ' + name + ': preparing inputs')
+	files = inputs()
+	print('Case ' + name + ': running')
+	result = run_isolated(name, files)
+	results['cases'].append(result)
+	for stage in STAGES:
+		if stage in result.get('stages', {}):
+			timing = result['stages'][stage]
+			print(str.format('  {0:<22} {1:10.3f} s {2:14.0f} /s', stage, timing['seconds'], timing['perSecond'] or 0))
+	if result.get('peakRss') is not None:
+		print(str.format('  {0:<22} {1:10.1f} MB', 'peak RSS', result['peakRss'] / 1024 ** 2))
+with open(resultsFile, 'wt') as file:
+	json.dump(results, file, indent=1)
+print('Results written to ' + resultsFile)
+if compareFile is not None:
+	with open(compareFile, 'rt') as file:
+		compare(json.load(file), results)
@@ -0,0 +1,23 @@
+# ------------------------------------------------------------------------------- #
+# celltowers - Cell tower population estimation as a library; the scripts at the #
+#              top of the repository are command line front ends to it           #
+#                                                                                 #
+#   from celltowers import Estimator, TowerIndex, load_towers, load_polygons      #
+#   estimator = Estimator('pop.csv', 'geometry.csv')                              #
+#   estimator.estimate(TowerIndex(load_towers('towers.csv')))                     #
+#   estimator.estimate(load_polygons('polygons.csv'))                             #
+#                                                                                 #
+# the grid is read by the first estimate and stays in memory for the next ones;  #
+# scipy is only imported by what needs it                                        #
+# ------------------------------------------------------------------------------- #
+
+from .points import load_grid, cell_size, PointWriter
+from .containment import PolygonIndex, PolygonTree, TowerIndex, PopulationTotals, load_towers, load_polygons, load_geometry, \
+	distinct_towers, assign_polygons, assign_nearest, allocate_fractional, sum_populations
+from .clustering import dbscan, centroid
+from .voronoi import tessellate, write_polygons
+from .estimation import Estimator, estimate_populations
+from .scenarios import Scenarios, masked_blocks, clustered_towers
+from .ascii_grid import read_header, read_blocks, cell_centres, rasterize
+from .cache import Cache
+from .instrumentation import Metrics
@@ -0,0 +1,100 @@
+# ------------------------------------------------------------------------------- #
+# ascii_grid.py - Streaming reader for ESRI ASCII grids (.asc) such as            #
+#                 CIV10adjv3.asc                                                  #
+# ------------------------------------------------------------------------------- #
+
+import itertools, numpy
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+CHUNK_ROWS           = 256 # rows parsed at a time; bounds the reader's memory
+ARCGIS_NO_DATA_VALUE = -3.40282346639e+038
+HEADER_KEYS          = { 'ncols': 'nCols', 'nrows': 'nRows', 'xllcorner': 'xllCorner', 'yllcorner': 'yllCorner',
+                         'xllcenter': 'xllCorner', 'yllcenter': 'yllCorner', 'cellsize': 'cellSize', 'nodata_value': 'noDataValue' }
+
+# ------------------------------------------------------------------------------- #
+# Reads the header of an open .asc file, leaving the file at the first grid row   #
+# header = { 'nCols', 'nRows', 'xllCorner', 'yllCorner', 'cellSize', 'noDataValue' }
+# ------------------------------------------------------------------------------- #
+def read_header(file):
+	header = { 'noDataValue': ARCGIS_NO_DATA_VALUE }
+	centered = []
+	while True:
+		position = file.tell()
+		line = file.readline()
+		data = line.split()
+		if len(data) != 2 or data[0].lower() not in HEADER_KEYS:
+			file.seek(position)
+			break
+		key = data[0].lower()
+		if key in ('xllcenter', 'yllcenter'):
+			centered.append(HEADER_KEYS[key])
+		header[HEADER_KEYS[key]] = float(data[1])
+	header['nCols'] = int(header['nCols'])
+	header['nRows'] = int(header['nRows'])
+	for key in centered: # corner of the grid, not centre of the lower-left cell
+		header[key] = header[key] - header['cellSize'] / 2
+	return header
+
+# ------------------------------------------------------------------------------- #
+# Reads the grid body in blocks of at most chunkRows rows                         #
+# yields (firstRow, block) where block is a float32 array of shape (rows, nCols)  #
+# with no-data and negative values already set to 0                              #
+# ------------------------------------------------------------------------------- #
+def read_blocks(file, header, chunkRows = CHUNK_ROWS):
+	noData = numpy.float32([ARCGIS_NO_DATA_VALUE, header['noDataValue']])
+	firstRow = 0
+	while firstRow < header['nRows']:
+		lines = list(itertools.islice(file, min(chunkRows, header['nRows'] - firstRow)))
+		if len(lines) == 0:
+			break
+		block = numpy.loadtxt(lines, dtype=numpy.float32, ndmin=2)
+		block[(block == noData[0]) | (block == noData[1]) | (block < 0)] = 0
+		yield firstRow, block
+		firstRow = firstRow + len(lines)
+
+# ------------------------------------------------------------------------------- #
+# Cell centre coordinates of a block of rows                                      #
+# returns lons (one per column) and lats (one per row)                            #
+# ------------------------------------------------------------------------------- #
+def cell_centres(header, firstRow, rows):
+	cellSize = header['cellSize']
+	lons = header['xllCorner'] + numpy.arange(header['nCols']) * cellSize + cellSize/2 # cellSize/2 to have values centered instead of top-left
+	lats = header['yllCorner'] + (header['nRows'] - (firstRow + numpy.arange(rows))) * cellSize + cellSize/2
+	return lons, lats
+
+# ------------------------------------------------------------------------------- #
+# Rasterizes a polygon onto a block of grid rows by scanline: for every row the   #
+# crossings of its centre line with the polygon edges are sorted, and a cell is   #
+# inside when an odd number of crossings lies to the west of its centre (same     #
+# result as Point.within for each cell centre, up to points on the boundary)      #
+# returns a boolean mask of shape (rows, nCols)                                   #
+# ------------------------------------------------------------------------------- #
+def rasterize(polygon, header, firstRow, rows):
+	lons, lats = cell_centres(header, firstRow, rows)
+	x1 = []
+	y1 = []
+	x2 = []
+	y2 = []
+	for ring in [polygon.exterior] + list(polygon.interiors):
+		coords = numpy.asarray(ring.coords)
+		x1.append(coords[:-1, 0])
+		y1.append(coords[:-1, 1])
+		x2.append(coords[1:, 0])
+		y2.append(coords[1:, 1])
+	x1 = numpy.concatenate(x1)
+	y1 = numpy.concatenate(y1)
+	x2 = numpy.concatenate(x2)
+	y2 = numpy.concatenate(y2)
+	minLat, maxLat = min(y1.min(), y2.min()), max(y1.max(), y2.max())
+	mask = numpy.zeros((rows, len(lons)), dtype=bool)
+	for i in range(rows):
+		lat = lats[i]
+		if lat < minLat or lat > maxLat:
+			continue
+		crossing = (y1 > lat) != (y2 > lat)
+		xs = x1[crossing] + (lat - y1[crossing]) * (x2[crossing] - x1[crossing]) / (y2[crossing] - y1[crossing])
+		xs.sort()
+		mask[i] = numpy.searchsorted(xs, lons, side='left') % 2 == 1
+	return mask
@@ -0,0 +1,113 @@
+# ------------------------------------------------------------------------------- #
+# cache.py - On-disk cache of parsed inputs (point grids, polygons, tower         #
+#            indexes, rasterized masks), keyed by the hash of the input files     #
+#            plus the parameters they were parsed with; least recently used       #
+#            entries are evicted once the cache grows past its size limit         #
+# ------------------------------------------------------------------------------- #
+
+import hashlib, os, pickle, tempfile
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+CACHE_FOLDER         = os.environ.get('CELL_TOWER_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'cell-tower-population'))
+CACHE_SIZE           = int(os.environ.get('CELL_TOWER_CACHE_SIZE', 2 * 1024 ** 3)) # bytes
+CACHE_EXTENSION      = '.pickle'
+FILE_EXTENSION       = '.entry' # entries streamed to disk by the caller instead of pickled
+HASH_BLOCK_SIZE      = 1024 ** 2
+
+# ------------------------------------------------------------------------------- #
+# SHA-1 of the contents of a file                                                 #
+# ------------------------------------------------------------------------------- #
+def file_hash(path):
+	digest = hashlib.sha1()
+	with open(path, 'rb') as file:
+		block = file.read(HASH_BLOCK_SIZE)
+		while len(block) > 0:
+			digest.update(block)
+			block = file.read(HASH_BLOCK_SIZE)
+	return digest.hexdigest()
+
+# ------------------------------------------------------------------------------- #
+# Cache - a folder of pickled entries, one file per key                           #
+# ------------------------------------------------------------------------------- #
+class Cache:
+
+	def __init__(self, folder = CACHE_FOLDER, maxBytes = CACHE_SIZE):
+		self.folder = folder
+		self.maxBytes = maxBytes
+		self.hashes = {}
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+
+	# key of an entry: what it is, the contents of the files it comes from and
+	# the parameters it was built with
+	def key(self, name, paths, params = ()):
+		digest = hashlib.sha1(name.encode('utf-8'))
+		for path in paths:
+			if path not in self.hashes:
+				self.hashes[path] = file_hash(path)
+			digest.update(self.hashes[path].encode('ascii'))
+		digest.update(repr(tuple(params)).encode('utf-8'))
+		return name + '-' + digest.hexdigest()
+
+	# the cached value, or None; a hit makes the entry the most recently used
+	def get(self, key):
+		path = os.path.join(self.folder, key + CACHE_EXTENSION)
+		try:
+			with open(path, 'rb') as file:
+				value = pickle.load(file)
+		except (OSError, EOFError, pickle.UnpicklingError, ImportError, AttributeError): # also entries of classes since moved
+			return None
+		os.utime(path)
+		return value
+
+	def put(self, key, value):
+		descriptor, temporary = tempfile.mkstemp(dir=self.folder)
+		with os.fdopen(descriptor, 'wb') as file:
+			pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(temporary, os.path.join(self.folder, key + CACHE_EXTENSION))
+		self.evict()
+
+	# path of an entry written with temporary and add_file, or None; a hit makes
+	# the entry the most recently used
+	def file(self, key):
+		path = os.path.join(self.folder, key + FILE_EXTENSION)
+		if not os.path.exists(path):
+			return None
+		os.utime(path)
+		return path
+
+	# a new empty file in the cache folder, to be filled and passed to add_file
+	def temporary(self):
+		descriptor, temporary = tempfile.mkstemp(dir=self.folder)
+		os.close(descriptor)
+		return temporary
+
+	def add_file(self, key, temporary):
+		os.replace(temporary, os.path.join(self.folder, key + FILE_EXTENSION))
+		self.evict()
+
+	# returns the cached value, computing and storing it on a miss
+	def cached(self, name, paths, params, compute):
+		key = self.key(name, paths, params)
+		value = self.get(key)
+		if value is None:
+			value = compute()
+			self.put(key, value)
+		return value
+
+	# removes least recently used entries until the cache fits in maxBytes
+	def evict(self):
+		entries = []
+		for entry in os.listdir(self.folder):
+			if entry.endswith((CACHE_EXTENSION, FILE_EXTENSION)):
+				stat = os.stat(os.path.join(self.folder, entry))
+				entries.append((stat.st_mtime, stat.st_size, entry))
+		entries.sort()
+		total = sum(entry[1] for entry in entries)
+		for mtime, size, entry in entries[:-1]: # never the newest entry
+			if total <= self.maxBytes:
+				break
+			os.remove(os.path.join(self.folder, entry))
+			total = total - size
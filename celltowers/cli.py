@@ -0,0 +1,70 @@
+# ------------------------------------------------------------------------------- #
+# cli.py - Command line handling shared by the scripts: --options parsing and     #
+#          opening of the input and output files                                  #
+# ------------------------------------------------------------------------------- #
+
+import math
+
+# ------------------------------------------------------------------------------- #
+# Option values; each raises ValueError when the value is not valid               #
+# ------------------------------------------------------------------------------- #
+def positive_int(value):
+	if not value.isdigit() or int(value) <= 0:
+		raise ValueError(value)
+	return int(value)
+
+def non_negative_int(value):
+	if not value.isdigit():
+		raise ValueError(value)
+	return int(value)
+
+def positive_float(value):
+	number = float(value)
+	if not math.isfinite(number) or number <= 0:
+		raise ValueError(value)
+	return number
+
+def non_empty(value):
+	if value == '':
+		raise ValueError(value)
+	return value
+
+# ------------------------------------------------------------------------------- #
+# Parses the --options of a script; flags take no value, values maps every        #
+# option that takes one to the function that parses it; an unknown or invalid     #
+# option prints the usage and exits with status 1                                 #
+# returns { option: value, True for flags }                                       #
+# ------------------------------------------------------------------------------- #
+def parse_options(options, flags, values, usage):
+	parsed = {}
+	for option in options:
+		name, equals, value = option.partition('=')
+		try:
+			if name in flags and equals == '':
+				parsed[name] = True
+			elif name in values:
+				parsed[name] = values[name](value)
+			else:
+				raise ValueError(option)
+		except ValueError:
+			usage()
+			exit(1)
+	return parsed
+
+# ------------------------------------------------------------------------------- #
+# Opens the files of a script in order, (path, mode) each, mode being an open()   #
+# mode or a function that opens the path (e.g. PointWriter); when one cannot be   #
+# opened the ones already open are closed and the script exits with status 2 for  #
+# the first file, 3 for the second and so on                                      #
+# ------------------------------------------------------------------------------- #
+def open_files(files):
+	opened = []
+	for path, mode in files:
+		try:
+			opened.append(open(path, mode) if isinstance(mode, str) else mode(path))
+		except OSError:
+			print('Could not open file ' + path)
+			for file in opened:
+				file.close()
+			exit(2 + len(opened))
+	return opened
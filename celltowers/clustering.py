@@ -0,0 +1,122 @@
+# ------------------------------------------------------------------------------- #
+# clustering.py - Clustering algorithm (DBSCAN) to identify cell towers that are #
+#                 close to each other; each cluster gets the centroid location    #
+#                 of its towers as a new coordinate                               #
+# Author: Thyago Mota                                                             #
+# Date: 01/24/2014                                                                #
+# ------------------------------------------------------------------------------- #
+
+import math, numpy
+from .distance import haversine, haversine_blocks, EARTH_RADIUS
+
+# ------------------------------------------------------------------------------- #
+# Calculates the centroid of a set of points                                      #
+# points = [ (lon, lat), ... ]                                                    #
+# ------------------------------------------------------------------------------- #
+def centroid(points):
+	sumLon = 0
+	sumLat = 0
+	total  = 0
+	for point in points:
+		sumLon = sumLon + point[0]
+		sumLat = sumLat + point[1]
+		total = total + 1
+	return [ sumLon / total, sumLat / total ]
+
+# ------------------------------------------------------------------------------- #
+# Builds a grid index of the towers: cells are tall and wide enough that every    #
+# tower within eps km of another is in the same cell or in one of the 8 around it #
+# lons, lats = tower coordinates as numpy arrays                                  #
+# returns cells[(col, row)] = [ index into lons/lats, ... ]                       #
+# ------------------------------------------------------------------------------- #
+def grid_index(lons, lats, eps):
+	maxLat = float(numpy.abs(lats).max()) if len(lats) > 0 else 0
+	# haversine distances are at least R * dLat, and at least about R * cos(maxLat) * dLon
+	height = math.degrees(eps / EARTH_RADIUS) * CELL_SLACK
+	ratio = math.sin(eps / (2 * EARTH_RADIUS)) / max(math.cos(math.radians(maxLat)), 1e-12)
+	width = math.degrees(2 * math.asin(min(ratio, 1))) * CELL_SLACK
+	cells = {}
+	cols = numpy.floor(lons / width).astype(numpy.int64).tolist()
+	rows = numpy.floor(lats / height).astype(numpy.int64).tolist()
+	for i in range(len(cols)):
+		cells.setdefault((cols[i], rows[i]), []).append(i)
+	return cells
+
+# ------------------------------------------------------------------------------- #
+# neighboors function that identifies locations that are nearby                   #
+# each grid cell measures its towers against the towers of the 9 cells around it  #
+# in one vectorized call; the vectorized kernel can differ from haversine in the #
+# last bits, so pairs within DISTANCE_TOLERANCE of eps are measured again with    #
+# haversine, which keeps the d <= eps decisions of the original pairwise loop     #
+# returns neighboors[tower] = [ tower, ... ] in the order of towers               #
+# ------------------------------------------------------------------------------- #
+def neighboors(towers, eps):
+	ids = list(towers)
+	lons = numpy.array([ towers[tower][0] for tower in ids ])
+	lats = numpy.array([ towers[tower][1] for tower in ids ])
+	cells = grid_index(lons, lats, eps)
+	neighboors = {}
+	for (col, row), members in cells.items():
+		candidates = []
+		for i in (col - 1, col, col + 1):
+			for j in (row - 1, row, row + 1):
+				candidates = candidates + cells.get((i, j), [])
+		candidates = numpy.array(sorted(candidates))
+		for firstRow, d in haversine_blocks(lons[members], lats[members], lons[candidates], lats[candidates]):
+			for r in range(len(d)):
+				tower = ids[members[firstRow + r]]
+				near = d[r] <= eps
+				for k in numpy.flatnonzero(numpy.abs(d[r] - eps) <= DISTANCE_TOLERANCE).tolist():
+					near[k] = haversine([towers[ids[candidates[k]]], towers[tower]]) <= eps
+				neighboors[tower] = [ ids[k] for k in candidates[near].tolist() if ids[k] != tower ]
+	return neighboors
+
+# ------------------------------------------------------------------------------- #
+# DBSCAN clustering algorithm                                                     #
+# ------------------------------------------------------------------------------- #	
+def dbscan(towers, eps, min):
+	clusters = []
+	visited = {}
+	clustered = {} # tower -> index of its cluster in clusters
+	nearby = neighboors(towers, eps)
+	for tower in towers:
+		visited[tower] = False
+	for tower in towers:
+		if visited[tower]:
+			continue
+		visited[tower] = True
+		# print( 'Visiting ' + str( tower ) )
+		n = nearby[tower]
+		# print( 'Neighboors of ' + str( tower ) + ': ' + str( n ) )
+		if len(n) >= min:			
+			newCluster = [tower]
+			# expand neighboor list
+			for other in n:
+				visited[other] = True
+				nn = nearby[other]
+				# print( nn )
+				if len(nn) >= min:
+					n = n + nn
+			n = list(set(n))
+			# print( 'Expanded neighboors of ' + str( tower ) + ': ' + str( n ) )
+			# add neighboors IF they are not in a cluster
+			for other in n:
+				if other == tower:
+					continue
+				if other not in clustered:
+					newCluster.append(other)
+					visited[other] = True # no need to revisit a location that is already in a cluster
+			# print(newCluster)
+			for other in newCluster:
+				clustered[other] = len(clusters)
+			clusters.append(newCluster)
+	return clusters
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+# DBSCAN parameters
+EPSILON      = 0.5 # km
+MIN_POINTS   = 1
+CELL_SLACK   = 1.000001 # grid cells are made slightly larger than eps to absorb rounding
+DISTANCE_TOLERANCE = 1e-9 # km; far above the ~1e-13 km gap between the two haversine kernels
@@ -0,0 +1,349 @@
+# ------------------------------------------------------------------------------- #
+# containment.py - Point-in-polygon assignment of gridded populations to the      #
+#                  cell tower Voronoi polygons                                    #
+# ------------------------------------------------------------------------------- #
+
+import math, numpy, shapely
+from shapely.geometry import Point, Polygon, MultiPolygon, LinearRing
+from shapely.prepared import prep
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+BUCKETS_PER_POLYGON  = 4 # on average, how many index buckets each polygon gets
+FRACTIONAL_CHUNK     = 65536 # grid cells clipped at a time by allocate_fractional
+
+# ------------------------------------------------------------------------------- #
+# PolygonIndex - uniform grid over the bounding box of all polygons; every bucket #
+# lists the polygons whose bounding box overlaps it, so a point only needs to be  #
+# tested against the few polygons registered in its own bucket                    #
+# polygons = { towerId: Polygon, ... }                                            #
+# ------------------------------------------------------------------------------- #
+class PolygonIndex:
+
+	def __init__(self, polygons, bucketsPerPolygon = BUCKETS_PER_POLYGON):
+		self.polygons = {}
+		self.bounds = {}
+		for towerId in polygons:
+			self.polygons[towerId] = prep(polygons[towerId])
+			self.bounds[towerId] = polygons[towerId].bounds
+		self.tests = 0
+		self.buckets = {}
+		if len(polygons) == 0:
+			return
+		self.minLon = min(b[0] for b in self.bounds.values())
+		self.minLat = min(b[1] for b in self.bounds.values())
+		maxLon = max(b[2] for b in self.bounds.values())
+		maxLat = max(b[3] for b in self.bounds.values())
+		side = int(math.ceil(math.sqrt(len(polygons) * bucketsPerPolygon)))
+		self.nCols = side
+		self.nRows = side
+		self.bucketWidth = max(maxLon - self.minLon, 1e-9) / self.nCols
+		self.bucketHeight = max(maxLat - self.minLat, 1e-9) / self.nRows
+		# polygons are registered in their original order so the first hit of a
+		# lookup is the same polygon a sequential scan would have found
+		for towerId in polygons:
+			b = self.bounds[towerId]
+			firstCol, firstRow = self.bucket(b[0], b[1])
+			lastCol, lastRow = self.bucket(b[2], b[3])
+			for col in range(firstCol, lastCol + 1):
+				for row in range(firstRow, lastRow + 1):
+					self.buckets.setdefault((col, row), []).append(towerId)
+
+	# (col, row) of the bucket containing a coordinate, clamped to the index
+	def bucket(self, lon, lat):
+		col = int((lon - self.minLon) / self.bucketWidth)
+		row = int((lat - self.minLat) / self.bucketHeight)
+		return (min(max(col, 0), self.nCols - 1), min(max(row, 0), self.nRows - 1))
+
+	# id of the polygon that contains the point, or None if no polygon does
+	def locate(self, lon, lat):
+		if len(self.buckets) == 0:
+			return None
+		point = None
+		for towerId in self.buckets.get(self.bucket(lon, lat), []):
+			b = self.bounds[towerId]
+			if lon < b[0] or lon > b[2] or lat < b[1] or lat > b[3]:
+				continue
+			if point is None:
+				point = Point(lon, lat)
+			self.tests = self.tests + 1
+			if self.polygons[towerId].contains(point): # same as point.within(polygon)
+				return towerId
+		return None
+
+# ------------------------------------------------------------------------------- #
+# Batch containment: every polygon decides membership for all of its candidate    #
+# points in a single vectorized call; candidates come from a lon-sorted copy of   #
+# the points, so a polygon only looks at the strip of points under its bounding   #
+# box                                                                             #
+# byLon = numpy.argsort(lon, kind='stable'), if already at hand                   #
+# returns towerIds, owner (index into towerIds per point, -1 if none), tests     #
+# ------------------------------------------------------------------------------- #
+def assign_polygons(polygons, lon, lat, byLon = None):
+	towerIds = list(polygons)
+	owner = numpy.full(len(lon), -1, dtype=numpy.int64)
+	if byLon is None:
+		byLon = numpy.argsort(lon, kind='stable')
+	sortedLon = lon[byLon]
+	tests = 0
+	for k in range(len(towerIds)):
+		polygon = polygons[towerIds[k]]
+		minLon, minLat, maxLon, maxLat = polygon.bounds
+		first = numpy.searchsorted(sortedLon, minLon, side='left')
+		last = numpy.searchsorted(sortedLon, maxLon, side='right')
+		candidates = byLon[first:last]
+		candidates = candidates[(lat[candidates] >= minLat) & (lat[candidates] <= maxLat) & (owner[candidates] < 0)]
+		tests = tests + len(candidates)
+		inside = shapely.contains_xy(polygon, lon[candidates], lat[candidates]) # same as Point.within
+		owner[candidates[inside]] = k
+	return towerIds, owner, tests
+
+# ------------------------------------------------------------------------------- #
+# Sums the population of each tower, see PopulationTotals                         #
+# ------------------------------------------------------------------------------- #
+def sum_populations(towerIds, owner, population):
+	totals = PopulationTotals(towerIds)
+	totals.add(owner, population)
+	return totals.populations()
+
+# ------------------------------------------------------------------------------- #
+# Lines of an open file, or of the file at a path                                 #
+# ------------------------------------------------------------------------------- #
+def read_lines(file):
+	if isinstance(file, str):
+		with open(file, 'rt') as opened:
+			for line in opened:
+				yield line
+	else:
+		for line in file:
+			yield line
+
+# ------------------------------------------------------------------------------- #
+# Reads a tower file (path or open file), either CSV (*_towers.csv) or TSV        #
+# (ANT_POS.TSV)                                                                   #
+# towers[cellID] = (lon, lat)                                                     #
+# ------------------------------------------------------------------------------- #
+def load_towers(file):
+	towers = {}
+	for line in read_lines(file):
+		line = line.strip()
+		if len(line) == 0:
+			continue
+		data = line.replace('\t', ',').split(',')
+		towers[int(data[0])] = (float(data[1]), float(data[2]))
+	return towers
+
+# ------------------------------------------------------------------------------- #
+# Polygon of the vertices listed for a tower: a single ring, or several rings     #
+# each closed by repeating its first vertex (see voronoi.write_polygons), where a #
+# clockwise ring is a hole in the piece before it and any other starts a piece    #
+# ------------------------------------------------------------------------------- #
+def rings_polygon(vertices):
+	rings = []
+	start = 0
+	for i in range(len(vertices)):
+		if i >= start + 3 and vertices[i] == vertices[start]:
+			rings.append(vertices[start:i + 1])
+			start = i + 1
+	if start < len(vertices):
+		rings.append(vertices[start:])
+	if len(rings) == 1:
+		return Polygon(rings[0])
+	pieces = []
+	for ring in rings:
+		if len(pieces) == 0 or LinearRing(ring).is_ccw:
+			pieces.append((ring, []))
+		else:
+			pieces[-1][1].append(ring)
+	return Polygon(*pieces[0]) if len(pieces) == 1 else MultiPolygon(pieces)
+
+# ------------------------------------------------------------------------------- #
+# Reads a polygon file (path or open file), tower_id, lon, lat per vertex         #
+# polygons[towerId] = Polygon (or MultiPolygon, see rings_polygon)                #
+# ------------------------------------------------------------------------------- #
+def load_polygons(file):
+	polygons = {}
+	for line in read_lines(file):
+		line = line.strip()
+		if len(line) == 0:
+			continue
+		data = line.split(',')
+		polygons.setdefault(int(data[0]), []).append([float(data[1]), float(data[2])])
+	for towerId in polygons:
+		polygons[towerId] = rings_polygon(polygons[towerId])
+	return polygons
+
+# ------------------------------------------------------------------------------- #
+# Reads a geometry file (path or open file, space separated lon,lat pairs) into a #
+# Polygon                                                                         #
+# ------------------------------------------------------------------------------- #
+def load_geometry(file):
+	geoData = []
+	for line in read_lines(file):
+		line = line.strip()
+		if len(line) == 0:
+			continue
+		for pair in line.split(' '):
+			d = pair.split(',')
+			geoData.append([float(d[0]), float(d[1])])
+	return Polygon(geoData)
+
+# ------------------------------------------------------------------------------- #
+# Towers at distinct locations: co-located towers share a single Voronoi cell,    #
+# owned by the first one listed                                                   #
+# returns towerIds, coords (numpy array of shape (len(towerIds), 2))             #
+# ------------------------------------------------------------------------------- #
+def distinct_towers(towers):
+	towerIds = []
+	coords = []
+	seen = set()
+	for towerId in towers:
+		if towers[towerId] in seen:
+			continue
+		seen.add(towers[towerId])
+		towerIds.append(towerId)
+		coords.append(towers[towerId])
+	return towerIds, numpy.array(coords, dtype=numpy.float64).reshape(-1, 2)
+
+# ------------------------------------------------------------------------------- #
+# TowerIndex - KD-tree over the tower locations; a Voronoi cell is the set of     #
+# points closer to its tower than to any other, so each point simply goes to its #
+# nearest tower, no polygons involved                                             #
+# towerIds lists the towers that own a cell, see distinct_towers                  #
+# ------------------------------------------------------------------------------- #
+class TowerIndex:
+
+	def __init__(self, towers):
+		from scipy.spatial import cKDTree
+		self.towerIds, coords = distinct_towers(towers)
+		self.tree = cKDTree(coords) if len(coords) > 0 else None
+
+	# index into towerIds of the nearest tower to every point (-1 if none)
+	def assign(self, lon, lat):
+		owner = numpy.full(len(lon), -1, dtype=numpy.int64)
+		if self.tree is None or len(lon) == 0:
+			return owner
+		distance, owner[:] = self.tree.query(numpy.column_stack((lon, lat)))
+		return owner
+
+# ------------------------------------------------------------------------------- #
+# PolygonTree - STRtree over a set of polygons, for sets that are queried block   #
+# after block; a point goes to the first polygon (in the order given) that        #
+# contains it, as in assign_polygons                                              #
+# ------------------------------------------------------------------------------- #
+class PolygonTree:
+
+	def __init__(self, polygons):
+		self.towerIds = list(polygons)
+		self.geometries = numpy.array([ polygons[towerId] for towerId in self.towerIds ], dtype=object)
+		shapely.prepare(self.geometries)
+		self.tree = shapely.STRtree(self.geometries)
+
+	# index into towerIds of the polygon containing every point (-1 if none);
+	# points = shapely.points(lon, lat), if already at hand
+	def assign(self, lon, lat, points = None):
+		owner = numpy.full(len(lon), len(self.towerIds), dtype=numpy.int64)
+		if len(self.towerIds) > 0 and len(lon) > 0:
+			point, polygon = self.tree.query(shapely.points(lon, lat) if points is None else points, predicate='within')
+			numpy.minimum.at(owner, point, polygon)
+		owner[owner == len(self.towerIds)] = -1
+		return owner
+
+# ------------------------------------------------------------------------------- #
+# Nearest tower assignment of a set of points; points outside the optional        #
+# boundary polygon are left unassigned                                            #
+# towers = { towerId: (lon, lat) } or a TowerIndex already built                  #
+# returns towerIds, owner (index into towerIds per point, -1 if none)            #
+# ------------------------------------------------------------------------------- #
+def assign_nearest(towers, lon, lat, boundary = None):
+	index = towers if isinstance(towers, TowerIndex) else TowerIndex(towers)
+	owner = numpy.full(len(lon), -1, dtype=numpy.int64)
+	inside = numpy.ones(len(lon), dtype=bool)
+	if boundary is not None and len(lon) > 0:
+		inside = shapely.contains_xy(boundary, lon, lat)
+	owner[inside] = index.assign(lon[inside], lat[inside])
+	return index.towerIds, owner
+
+# ------------------------------------------------------------------------------- #
+# PopulationTotals - per tower population sums, accumulated over any number of    #
+# blocks of points; towers come out in the order their first point was added,    #
+# which is the order the per-point loop produces                                  #
+# ------------------------------------------------------------------------------- #
+class PopulationTotals:
+
+	def __init__(self, towerIds):
+		self.towerIds = towerIds
+		self.totals = numpy.zeros(len(towerIds))
+		self.firsts = numpy.full(len(towerIds), numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+		self.points = 0
+
+	# owner holds an index into towerIds per point, -1 for unassigned points
+	def add(self, owner, population):
+		hit = owner >= 0
+		self.totals += numpy.bincount(owner[hit], weights=population[hit], minlength=len(self.towerIds))
+		owners, firsts = numpy.unique(owner[hit], return_index=True)
+		firsts = numpy.flatnonzero(hit)[firsts] + self.points
+		self.firsts[owners] = numpy.minimum(self.firsts[owners], firsts)
+		self.points = self.points + len(owner)
+
+	# adds shares of points: population[i] goes to towerIds[owner[i]] and comes
+	# from point point[i] of a block of size points
+	def add_shares(self, point, owner, population, size):
+		self.totals += numpy.bincount(owner, weights=population, minlength=len(self.towerIds))
+		numpy.minimum.at(self.firsts, owner, point + self.points)
+		self.points = self.points + size
+
+	# appends the points of another PopulationTotals over the same towers
+	def merge(self, other):
+		self.totals += other.totals
+		self.firsts = numpy.minimum(self.firsts, numpy.where(other.firsts == numpy.iinfo(numpy.int64).max, other.firsts, other.firsts + self.points))
+		self.points = self.points + other.points
+
+	# { towerId: population } for the towers that got at least one point
+	def populations(self):
+		estimatedPopulations = {}
+		for k in numpy.argsort(self.firsts, kind='stable'):
+			if self.firsts[k] == numpy.iinfo(numpy.int64).max:
+				break
+			estimatedPopulations[self.towerIds[k]] = self.totals[k]
+		return estimatedPopulations
+
+# ------------------------------------------------------------------------------- #
+# Area weighted allocation: each grid cell (a square of cellSize centred on its   #
+# point) is shared among the polygons it overlaps, in proportion to the area of  #
+# the overlap. Cells lying fully inside the polygon that contains their centre   #
+# go to it whole; only the others are intersected with the polygons an STRtree   #
+# finds around them                                                               #
+# polygons = { towerId: Polygon } or a PolygonTree (build it once to allocate     #
+# block after block)                                                              #
+# returns PopulationTotals over the polygons, number of boundary cells clipped    #
+# ------------------------------------------------------------------------------- #
+def allocate_fractional(polygons, lon, lat, population, cellSize, chunkPoints = FRACTIONAL_CHUNK):
+	tree = polygons if isinstance(polygons, PolygonTree) else PolygonTree(polygons)
+	geometries = tree.geometries
+	totals = PopulationTotals(tree.towerIds)
+	half = cellSize / 2
+	cellArea = cellSize * cellSize
+	clipped = 0
+	for first in range(0, len(lon), chunkPoints):
+		x = numpy.asarray(lon[first:first + chunkPoints], dtype=numpy.float64)
+		y = numpy.asarray(lat[first:first + chunkPoints], dtype=numpy.float64)
+		weight = numpy.asarray(population[first:first + chunkPoints], dtype=numpy.float64)
+		cells = shapely.box(x - half, y - half, x + half, y + half)
+		owner = tree.assign(x, y)
+		whole = owner >= 0
+		whole[whole] = shapely.contains(geometries[owner[whole]], cells[whole])
+		boundary = numpy.flatnonzero(~whole)
+		pairs = tree.tree.query(cells[boundary], predicate='intersects')
+		point = boundary[pairs[0]]
+		share = shapely.area(shapely.intersection(cells[point], geometries[pairs[1]])) / cellArea
+		wholePoints = numpy.flatnonzero(whole)
+		# whole cells and shares of boundary cells, in grid order
+		point = numpy.concatenate((wholePoints, point))
+		tower = numpy.concatenate((owner[wholePoints], pairs[1]))
+		amount = numpy.concatenate((weight[wholePoints], weight[point[len(wholePoints):]] * share))
+		order = numpy.argsort(point, kind='stable')
+		totals.add_shares(point[order], tower[order], amount[order], len(x))
+		clipped = clipped + len(boundary)
+	return totals, clipped
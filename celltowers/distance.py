@@ -0,0 +1,53 @@
+# ------------------------------------------------------------------------------- #
+# distance.py - Great circle (haversine) distances between towers, one pair at a  #
+#               time or vectorized over numpy arrays                              #
+# ------------------------------------------------------------------------------- #
+
+import math, numpy
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+EARTH_RADIUS         = 6372.8 # km
+BLOCK_ELEMENTS       = 1 << 22 # distances per tile of haversine_blocks (32 MB of float64)
+
+# ------------------------------------------------------------------------------- #
+# haversine function that calculates the distance (in km) between two points      #
+# ------------------------------------------------------------------------------- #
+def haversine( XY ):
+	p1 = [ x * ( math.pi / 180 ) for x in XY[0] ]
+	p2 = [ x * ( math.pi / 180 ) for x in XY[1] ]
+	d_lon = p1[0] - p2[0]
+	d_lat = p1[1] - p2[1]
+	h = (math.sin(d_lat/2))**2 + math.cos(p1[1]) * math.cos(p2[1]) * (math.sin(d_lon/2))**2
+	return EARTH_RADIUS * 2 * math.atan2( math.sqrt(h), math.sqrt(1-h) )
+
+# ------------------------------------------------------------------------------- #
+# Vectorized haversine: same formula, over arrays that broadcast against each     #
+# other, e.g. one point against many or a column of points against a row         #
+# ------------------------------------------------------------------------------- #
+def haversine_many(lon1, lat1, lon2, lat2):
+	lon1 = numpy.asarray(lon1) * ( math.pi / 180 )
+	lat1 = numpy.asarray(lat1) * ( math.pi / 180 )
+	lon2 = numpy.asarray(lon2) * ( math.pi / 180 )
+	lat2 = numpy.asarray(lat2) * ( math.pi / 180 )
+	d_lon = lon1 - lon2
+	d_lat = lat1 - lat2
+	h = numpy.sin(d_lat/2)**2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin(d_lon/2)**2
+	return EARTH_RADIUS * 2 * numpy.arctan2( numpy.sqrt(h), numpy.sqrt(1-h) )
+
+# ------------------------------------------------------------------------------- #
+# Many-to-many distances, tiled so that no more than blockElements distances are  #
+# held at once                                                                    #
+# yields (firstRow, distances) where distances[i, j] is between point             #
+# firstRow + i of the first set and point j of the second                         #
+# ------------------------------------------------------------------------------- #
+def haversine_blocks(lon1, lat1, lon2, lat2, blockElements = BLOCK_ELEMENTS):
+	lon1 = numpy.asarray(lon1, dtype=numpy.float64)
+	lat1 = numpy.asarray(lat1, dtype=numpy.float64)
+	lon2 = numpy.asarray(lon2, dtype=numpy.float64)
+	lat2 = numpy.asarray(lat2, dtype=numpy.float64)
+	blockRows = max(1, blockElements // max(len(lon2), 1))
+	for firstRow in range(0, len(lon1), blockRows):
+		lastRow = min(firstRow + blockRows, len(lon1))
+		yield firstRow, haversine_many(lon1[firstRow:lastRow, None], lat1[firstRow:lastRow, None], lon2[None, :], lat2[None, :])
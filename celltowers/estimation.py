@@ -0,0 +1,101 @@
+# ------------------------------------------------------------------------------- #
+# estimation.py - Population estimates per tower or polygon. An Estimator keeps   #
+#                 the gridded population, and what is derived from it (points     #
+#                 inside the geometry, lon-sorted order, grid spacing), resident  #
+#                 once loaded, so that any number of tower or polygon sets can be #
+#                 estimated in one process without reading the grid again         #
+# ------------------------------------------------------------------------------- #
+
+import numpy, shapely
+from .points import load_grid, cell_size
+from .containment import TowerIndex, PolygonTree, PopulationTotals, load_geometry, assign_polygons, allocate_fractional
+
+# ------------------------------------------------------------------------------- #
+# Estimator - the grid and the geometry are loaded on first use                   #
+# grid = path of a point file (text or .npy) or (lon, lat, population)            #
+# boundary = Polygon, path of a geometry file or None; points outside it are not  #
+# assigned to towers (polygons are assumed to be clipped to it already)           #
+# stats holds figures of the last estimate: outside, tests (polygon dicts only),  #
+# clipped, cellSize                                                               #
+# ------------------------------------------------------------------------------- #
+class Estimator:
+
+	def __init__(self, grid, boundary = None):
+		self.grid = grid
+		self.boundary = boundary
+		self.loaded = None
+		self.inside = None
+		self.byLon = None
+		self.spacing = None
+		self.stats = {}
+
+	# lon, lat, population
+	def points(self):
+		if self.loaded is None:
+			self.loaded = load_grid(self.grid) if isinstance(self.grid, str) else tuple(self.grid)
+		return self.loaded
+
+	def geometry(self):
+		if isinstance(self.boundary, str):
+			self.boundary = load_geometry(self.boundary)
+		return self.boundary
+
+	# mask of the points inside the geometry
+	def points_inside(self):
+		if self.inside is None:
+			lon, lat, population = self.points()
+			if self.geometry() is None or len(lon) == 0:
+				self.inside = numpy.ones(len(lon), dtype=bool)
+			else:
+				self.inside = shapely.contains_xy(self.geometry(), lon, lat)
+		return self.inside
+
+	def sorted_by_lon(self):
+		if self.byLon is None:
+			self.byLon = numpy.argsort(self.points()[0], kind='stable')
+		return self.byLon
+
+	def cell_size(self):
+		if self.spacing is None:
+			self.spacing = cell_size(self.points()[0])
+		return self.spacing
+
+	# regions = TowerIndex or { towerId: (lon, lat) }: every point goes to its
+	# nearest tower (build the TowerIndex once to reuse it across calls);
+	# { towerId: Polygon } or PolygonTree: every point goes to the polygon that
+	# contains it, or with fractional (a cell size, 0 for the grid spacing) every
+	# cell is shared among the polygons it overlaps (build the PolygonTree once to
+	# reuse its STRtree across calls)
+	# returns { towerId: population } in the order population_estimator.py writes
+	def estimate(self, regions, fractional = None):
+		lon, lat, population = self.points()
+		first = None if isinstance(regions, (TowerIndex, PolygonTree)) else next(iter(regions.values()), None)
+		if isinstance(regions, TowerIndex) or isinstance(first, tuple):
+			index = regions if isinstance(regions, TowerIndex) else TowerIndex(regions)
+			inside = self.points_inside()
+			owner = numpy.full(len(lon), -1, dtype=numpy.int64)
+			owner[inside] = index.assign(lon[inside], lat[inside])
+			totals = PopulationTotals(index.towerIds)
+			totals.add(owner, population)
+			self.stats = { 'outside': int(len(lon) - inside.sum()) }
+		elif fractional is not None:
+			size = fractional if fractional > 0 else self.cell_size()
+			totals, clipped = allocate_fractional(regions, lon, lat, population, size)
+			self.stats = { 'clipped': clipped, 'cellSize': size }
+		elif isinstance(regions, PolygonTree):
+			totals = PopulationTotals(regions.towerIds)
+			totals.add(regions.assign(lon, lat), population)
+			self.stats = {}
+		else:
+			towerIds, owner, tests = assign_polygons(regions, lon, lat, self.sorted_by_lon())
+			totals = PopulationTotals(towerIds)
+			totals.add(owner, population)
+			self.stats = { 'tests': tests }
+		return totals.populations()
+
+# ------------------------------------------------------------------------------- #
+# One-off estimate, see Estimator.estimate; keep an Estimator to estimate more    #
+# than one set of regions over the same grid                                      #
+# ------------------------------------------------------------------------------- #
+def estimate_populations(regions, grid, boundary = None, fractional = None):
+	return Estimator(grid, boundary).estimate(regions, fractional)
@@ -0,0 +1,168 @@
+# ------------------------------------------------------------------------------- #
+# incremental.py - Keeps the point-to-tower assignment of a run so that, when the #
+#                  tower inventory changes, only the points near the changed      #
+#                  towers are reassigned and only their towers are re-summed      #
+# ------------------------------------------------------------------------------- #
+
+import numpy, shapely
+from .containment import distinct_towers
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+NO_POINT             = numpy.iinfo(numpy.int64).max
+STATE_KEYS           = ['towerIds', 'coords', 'active', 'owner', 'totals', 'firsts', 'radius']
+
+# ------------------------------------------------------------------------------- #
+# The state of a run (a dict of numpy arrays), one slot per tower ever seen:      #
+#   towerIds[slot], coords[slot] = (lon, lat), active[slot] = owns a cell         #
+#   owner[point] = slot of the point's nearest active tower, -1 outside boundary  #
+#   totals[slot] = population, firsts[slot] = first point owned (output order)    #
+#   radius[slot] = largest distance from the tower to a point it owns            #
+# Co-located towers share one cell, owned by the first one listed, as in          #
+# containment.distinct_towers; the others get no slot                             #
+# ------------------------------------------------------------------------------- #
+def build_state(towers, lon, lat, population, boundary):
+	towerIds, coords = distinct_towers(towers)
+	state = {
+		'towerIds': numpy.array(towerIds, dtype=numpy.int64),
+		'coords': coords,
+		'active': numpy.ones(len(towerIds), dtype=bool),
+		'owner': numpy.full(len(lon), -1, dtype=numpy.int32),
+		'totals': numpy.zeros(len(towerIds)),
+		'firsts': numpy.full(len(towerIds), NO_POINT, dtype=numpy.int64),
+		'radius': numpy.zeros(len(towerIds)),
+	}
+	inside = shapely.contains_xy(boundary, lon, lat) if len(lon) > 0 else numpy.zeros(0, dtype=bool)
+	state['owner'][inside] = nearest(state, lon[inside], lat[inside])
+	refresh(state, numpy.arange(len(towerIds)), lon, lat, population)
+	return state
+
+# written through an open file so that numpy does not add .npz to the path
+def save_state(path, state):
+	with open(path, 'wb') as file:
+		numpy.savez(file, **state)
+
+def load_state(path):
+	data = numpy.load(path)
+	return dict((key, data[key]) for key in STATE_KEYS)
+
+# ------------------------------------------------------------------------------- #
+# Slot of the nearest active tower for every point                                #
+# ------------------------------------------------------------------------------- #
+def nearest(state, lon, lat):
+	from scipy.spatial import cKDTree
+	slots = numpy.flatnonzero(state['active'])
+	if len(slots) == 0 or len(lon) == 0:
+		return numpy.full(len(lon), -1, dtype=numpy.int32)
+	distance, k = cKDTree(state['coords'][slots]).query(numpy.column_stack((lon, lat)))
+	return slots[k]
+
+# ------------------------------------------------------------------------------- #
+# Recomputes totals, firsts and radius of the given slots from their points;      #
+# sums are over the points in grid order, as in a full run                        #
+# ------------------------------------------------------------------------------- #
+def refresh(state, slots, lon, lat, population):
+	owner = state['owner']
+	points = numpy.flatnonzero(numpy.isin(owner, slots))
+	owners = owner[points]
+	size = len(state['towerIds'])
+	totals = numpy.bincount(owners, weights=numpy.asarray(population, dtype=numpy.float64)[points], minlength=size)
+	firsts = numpy.full(size, NO_POINT, dtype=numpy.int64)
+	numpy.minimum.at(firsts, owners, points)
+	radius = numpy.zeros(size)
+	distance = numpy.hypot(lon[points] - state['coords'][owners, 0], lat[points] - state['coords'][owners, 1])
+	numpy.maximum.at(radius, owners, distance)
+	state['totals'][slots] = totals[slots]
+	state['firsts'][slots] = firsts[slots]
+	state['radius'][slots] = radius[slots]
+
+# ------------------------------------------------------------------------------- #
+# Brings the state up to date with a new tower inventory                          #
+# returns (added, removed, moved, points reassigned)                              #
+# ------------------------------------------------------------------------------- #
+def update(state, towers, lon, lat, population):
+	towerIds, coords = distinct_towers(towers)
+	slotOf = dict((towerId, slot) for slot, towerId in enumerate(state['towerIds'].tolist()))
+	wanted = dict(zip(towerIds, map(tuple, coords.tolist())))
+	added = []
+	removed = []
+	moved = []
+	for slot in numpy.flatnonzero(state['active']).tolist():
+		towerId = int(state['towerIds'][slot])
+		if towerId not in wanted:
+			removed.append(slot)
+		elif wanted[towerId] != tuple(state['coords'][slot]):
+			moved.append(slot)
+	# a tower listed where a tower that is gone stood (or one it now comes before,
+	# see distinct_towers) takes over its slot: same cell, nothing to reassign
+	freed = dict((tuple(state['coords'][slot].tolist()), slot) for slot in removed)
+	for towerId in towerIds:
+		if len(freed) == 0:
+			break
+		if towerId in slotOf and state['active'][slotOf[towerId]]:
+			continue
+		slot = freed.pop(wanted[towerId], None)
+		if slot is None:
+			continue
+		oldId = int(state['towerIds'][slot])
+		if towerId in slotOf: # its own inactive slot goes to the tower that is gone
+			state['towerIds'][slotOf[towerId]] = oldId
+			slotOf[oldId] = slotOf[towerId]
+		else:
+			del slotOf[oldId]
+		state['towerIds'][slot] = towerId
+		slotOf[towerId] = slot
+		removed.remove(slot)
+	for towerId in towerIds:
+		if towerId not in slotOf:
+			slotOf[towerId] = grow(state, towerId)
+			added.append(slotOf[towerId])
+		elif not state['active'][slotOf[towerId]]:
+			added.append(slotOf[towerId])
+	if len(added) + len(removed) + len(moved) == 0:
+		return (0, 0, 0, 0)
+	# a point can only move to a new tower p if it is closer to p than to its owner
+	# q, and |p - q| < 2 * radius[q] for such owners
+	oldCoords = state['coords'].copy()
+	for slot in added + moved:
+		state['coords'][slot] = wanted[int(state['towerIds'][slot])]
+	gone = numpy.array(removed + moved, dtype=numpy.int64)
+	candidates = [gone]
+	for slot in added + moved:
+		d = numpy.hypot(oldCoords[:, 0] - state['coords'][slot, 0], oldCoords[:, 1] - state['coords'][slot, 1])
+		candidates.append(numpy.flatnonzero(state['active'] & (d < 2 * state['radius'])))
+	candidates = numpy.unique(numpy.concatenate(candidates))
+	state['active'][removed] = False
+	state['active'][added] = True
+	points = numpy.flatnonzero(numpy.isin(state['owner'], candidates))
+	before = state['owner'][points]
+	after = nearest(state, lon[points], lat[points])
+	state['owner'][points] = after
+	touched = numpy.unique(numpy.concatenate((before, after, gone, numpy.array(added, dtype=numpy.int64))))
+	touched = touched[touched >= 0]
+	refresh(state, touched, lon, lat, population)
+	return (len(added), len(removed), len(moved), int((before != after).sum()))
+
+# ------------------------------------------------------------------------------- #
+# Adds a slot for a tower never seen before, inactive until update activates it   #
+# ------------------------------------------------------------------------------- #
+def grow(state, towerId):
+	state['towerIds'] = numpy.append(state['towerIds'], towerId)
+	state['coords'] = numpy.vstack((state['coords'], [[numpy.nan, numpy.nan]]))
+	state['active'] = numpy.append(state['active'], False)
+	state['totals'] = numpy.append(state['totals'], 0.)
+	state['firsts'] = numpy.append(state['firsts'], NO_POINT)
+	state['radius'] = numpy.append(state['radius'], 0.)
+	return len(state['towerIds']) - 1
+
+# ------------------------------------------------------------------------------- #
+# { towerId: population } in the order of a full run                              #
+# ------------------------------------------------------------------------------- #
+def estimated_populations(state):
+	estimatedPopulations = {}
+	for slot in numpy.argsort(state['firsts'], kind='stable').tolist():
+		if state['firsts'][slot] == NO_POINT:
+			break
+		estimatedPopulations[int(state['towerIds'][slot])] = state['totals'][slot]
+	return estimatedPopulations
@@ -0,0 +1,112 @@
+# ------------------------------------------------------------------------------- #
+# instrumentation.py - Per-stage timings, throughput, counters (rows, points,     #
+#                      containment tests...) and memory high-water marks for the  #
+#                      scripts, printed as they go and optionally written as one  #
+#                      JSON record per line to a metrics file; each stage can     #
+#                      also be profiled with cProfile                             #
+# ------------------------------------------------------------------------------- #
+
+import cProfile, json, os, sys, time
+try:
+	import resource
+except ImportError: # not available on Windows; memory is then not recorded
+	resource = None
+
+# ------------------------------------------------------------------------------- #
+# Peak resident set size of this process so far, in bytes (None if unknown)       #
+# ------------------------------------------------------------------------------- #
+def peak_rss():
+	if resource is None:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss if sys.platform == 'darwin' else rss * 1024 # kB on Linux
+
+def megabytes(size):
+	return 'unknown' if size is None else str.format('{0:.1f} MB', size / 1024 ** 2)
+
+# ------------------------------------------------------------------------------- #
+# Metrics - the stages of one run of a script                                     #
+# metricsFile: JSON lines, one record per stage and one for the whole run         #
+# profileFolder: a cProfile dump per stage, script-stage.prof                     #
+# ------------------------------------------------------------------------------- #
+class Metrics:
+
+	def __init__(self, script, metricsFile = None, profileFolder = None):
+		self.script = os.path.splitext(os.path.basename(script))[0]
+		self.startTime = time.perf_counter()
+		self.file = open(metricsFile, 'at') if metricsFile is not None else None
+		self.profileFolder = profileFolder
+		if profileFolder is not None and not os.path.isdir(profileFolder):
+			os.makedirs(profileFolder)
+		self.stages = []
+
+	# starts a stage; see Stage.end
+	def begin(self, name):
+		return Stage(self, name).start()
+
+	def record(self, entry):
+		entry = dict([('script', self.script), ('time', time.strftime('%Y-%m-%dT%H:%M:%S'))] + list(entry.items()))
+		if self.file is not None:
+			self.file.write(json.dumps(entry) + '\n')
+			self.file.flush()
+
+	# writes the record of the whole run and closes the metrics file
+	def close(self):
+		seconds = time.perf_counter() - self.startTime
+		self.record({ 'event': 'run', 'seconds': seconds, 'peakRss': peak_rss(),
+		              'stages': dict((stage.name, stage.seconds) for stage in self.stages) })
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+# ------------------------------------------------------------------------------- #
+# Stage - times one stage of a script, between Metrics.begin and end()            #
+# count(name, n) adds to a counter, reported with its rate per second            #
+# progress(name, done, total, every) prints a line each time done passes a        #
+# multiple of every                                                               #
+# ------------------------------------------------------------------------------- #
+class Stage:
+
+	def __init__(self, metrics, name):
+		self.metrics = metrics
+		self.name = name
+		self.counts = {}
+		self.seconds = 0.
+		self.reported = 0
+		self.profile = None
+
+	def start(self):
+		if self.metrics.profileFolder is not None:
+			self.profile = cProfile.Profile()
+			self.profile.enable()
+		self.startTime = time.perf_counter()
+		self.cpuStart = time.process_time()
+		return self
+
+	def end(self):
+		self.seconds = time.perf_counter() - self.startTime
+		cpuSeconds = time.process_time() - self.cpuStart
+		if self.profile is not None:
+			self.profile.disable()
+			self.profile.dump_stats(os.path.join(self.metrics.profileFolder, self.metrics.script + '-' + self.name.replace(' ', '_') + '.prof'))
+		rates = dict((name + 'PerSecond', count / self.seconds if self.seconds > 0 else None) for name, count in self.counts.items())
+		memory = peak_rss()
+		self.metrics.stages.append(self)
+		self.metrics.record(dict([('event', 'stage'), ('stage', self.name), ('seconds', self.seconds), ('cpuSeconds', cpuSeconds),
+		                          ('peakRss', memory)] + list(self.counts.items()) + list(rates.items())))
+		text = 'Stage ' + self.name + ': ' + str.format('{0:.3f}', self.seconds) + ' s'
+		for name, count in self.counts.items():
+			text = text + ', ' + str(count) + ' ' + name
+			if self.seconds > 0:
+				text = text + ' (' + str.format('{0:.0f}', count / self.seconds) + '/s)'
+		print(text + ', peak RSS ' + megabytes(memory))
+
+	def count(self, name, n = 1):
+		self.counts[name] = self.counts.get(name, 0) + int(n)
+
+	def progress(self, name, done, total, every):
+		if done // every > self.reported // every:
+			elapsed = time.perf_counter() - self.startTime
+			rate = str.format('{0:.0f}', done / elapsed) if elapsed > 0 else '-'
+			print('  ' + str(done) + ' of ' + str(total) + ' ' + name + ' (' + str.format('{0:.1f}', 100. * done / max(total, 1)) + '%), ' + rate + ' ' + name + '/s')
+		self.reported = done
@@ -0,0 +1,83 @@
+# ------------------------------------------------------------------------------- #
+# points.py - Gridded population point files written by grid_converter.py and     #
+#             read by population_estimator.py: either text (lon,lat,population)   #
+#             or binary .npy, a float64 array of shape (n, 3) that is memory      #
+#             mapped on load; both hold the same rounded values                   #
+# ------------------------------------------------------------------------------- #
+
+import numpy, struct
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+NPY_EXTENSION        = '.npy'
+NPY_HEADER_SIZE      = 128 # fixed, so the row count can be filled in once known
+COORD_DECIMALS       = 5
+POPULATION_DECIMALS  = 2
+
+# ------------------------------------------------------------------------------- #
+# .npy (version 1.0) header for a float64 array of shape (rows, 3), padded to     #
+# NPY_HEADER_SIZE bytes                                                           #
+# ------------------------------------------------------------------------------- #
+def npy_header(rows):
+	text = "{'descr': '<f8', 'fortran_order': False, 'shape': (" + str(rows) + ", 3), }"
+	text = text + ' ' * (NPY_HEADER_SIZE - 10 - len(text) - 1) + '\n'
+	return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(text)) + text.encode('latin1')
+
+# ------------------------------------------------------------------------------- #
+# PointWriter - appends blocks of points to a text or .npy file, chosen by the    #
+# file extension unless binary is given; the .npy row count is written on close   #
+# binary values are rounded to the decimals of the text format, so that both     #
+# formats give the same estimates, unless rounded is False                        #
+# ------------------------------------------------------------------------------- #
+class PointWriter:
+
+	def __init__(self, path, binary = None, rounded = True):
+		self.binary = path.lower().endswith(NPY_EXTENSION) if binary is None else binary
+		self.rounded = rounded
+		self.rows = 0
+		if self.binary:
+			self.file = open(path, 'wb')
+			self.file.write(npy_header(0))
+		else:
+			self.file = open(path, 'wt')
+
+	def write(self, lon, lat, population):
+		points = numpy.column_stack((lon, lat, population)).astype('<f8')
+		if self.binary:
+			if self.rounded:
+				points[:, :2] = numpy.round(points[:, :2], COORD_DECIMALS)
+				points[:, 2] = numpy.round(points[:, 2], POPULATION_DECIMALS)
+			self.file.write(points.tobytes())
+		else:
+			numpy.savetxt(self.file, points, fmt='%.5f,%.5f,%.2f')
+		self.rows = self.rows + len(lon)
+
+	def close(self):
+		if self.binary:
+			self.file.seek(0)
+			self.file.write(npy_header(self.rows))
+		self.file.close()
+
+# ------------------------------------------------------------------------------- #
+# Reads a point file (path or open file) into lon, lat and population columns;    #
+# .npy files are memory mapped, so the columns are views with no copy             #
+# ------------------------------------------------------------------------------- #
+def load_grid(file):
+	path = file if isinstance(file, str) else file.name
+	if path.lower().endswith(NPY_EXTENSION):
+		data = numpy.load(path, mmap_mode='r')
+	else:
+		data = numpy.loadtxt(file, delimiter=',', ndmin=2)
+		if data.size == 0: # no points at all, e.g. no populated cell inside the geometry
+			data = data.reshape(0, 3)
+	return data[:, 0], data[:, 1], data[:, 2]
+
+# ------------------------------------------------------------------------------- #
+# Grid spacing of a set of points, as the median gap between distinct longitudes  #
+# (the text format rounds coordinates to 5 decimals, so gaps vary slightly)       #
+# ------------------------------------------------------------------------------- #
+def cell_size(lon):
+	gaps = numpy.diff(numpy.unique(lon))
+	gaps = gaps[gaps > 0]
+	return float(numpy.median(gaps)) if len(gaps) > 0 else 0.
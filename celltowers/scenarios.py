@@ -0,0 +1,95 @@
+# ------------------------------------------------------------------------------- #
+# scenarios.py - Estimates many tower or polygon sets (scenarios) in a single     #
+#                pass over the gridded population: every block of points is read  #
+#                and masked once, then assigned under each scenario in turn       #
+# ------------------------------------------------------------------------------- #
+
+import numpy, shapely
+from .ascii_grid import read_header, read_blocks, cell_centres, rasterize, CHUNK_ROWS
+from .points import load_grid
+from .containment import TowerIndex, PolygonTree, PopulationTotals
+from .clustering import dbscan, centroid, MIN_POINTS
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+BLOCK_POINTS         = 65536 # points of a point file assigned at a time
+ASC_EXTENSION        = '.asc'
+
+# ------------------------------------------------------------------------------- #
+# Blocks of the populated points of a grid that lie inside the boundary           #
+# grid = path of an .asc grid (streamed, chunkRows rows at a time) or of a point  #
+# file (text or .npy, BLOCK_POINTS points at a time)                              #
+# yields cells, lon, lat, population (float64); cells is the number of grid cells #
+# or points the block was masked from                                             #
+# ------------------------------------------------------------------------------- #
+def masked_blocks(grid, boundary, chunkRows = CHUNK_ROWS):
+	if grid.lower().endswith(ASC_EXTENSION):
+		with open(grid, 'rt') as file:
+			header = read_header(file)
+			for firstRow, block in read_blocks(file, header, chunkRows):
+				inside = (block != 0) & rasterize(boundary, header, firstRow, len(block))
+				rows, cols = numpy.nonzero(inside)
+				lons, lats = cell_centres(header, firstRow, len(block))
+				yield block.size, lons[cols], lats[rows], block[inside].astype(numpy.float64)
+		return
+	lon, lat, population = load_grid(grid)
+	for first in range(0, len(lon), BLOCK_POINTS):
+		blockLon = numpy.asarray(lon[first:first + BLOCK_POINTS], dtype=numpy.float64)
+		blockLat = numpy.asarray(lat[first:first + BLOCK_POINTS], dtype=numpy.float64)
+		inside = shapely.contains_xy(boundary, blockLon, blockLat)
+		yield len(blockLon), blockLon[inside], blockLat[inside], numpy.asarray(population[first:first + BLOCK_POINTS], dtype=numpy.float64)[inside]
+
+# ------------------------------------------------------------------------------- #
+# Towers after DBSCAN: the towers of every cluster of more than one tower are     #
+# replaced by a single venue at their centroid, under the id of the tower that    #
+# seeded the cluster (clustering.py numbers its clusters instead)                 #
+# ------------------------------------------------------------------------------- #
+def clustered_towers(towers, eps, minPoints = MIN_POINTS):
+	venue = {}
+	for cluster in dbscan(towers, eps, minPoints):
+		if len(cluster) > 1:
+			center = centroid([ towers[tower] for tower in cluster ])
+			for tower in cluster:
+				venue[tower] = (cluster[0], (center[0], center[1]))
+	venues = {}
+	for tower in towers:
+		towerId, location = venue.get(tower, (tower, towers[tower]))
+		if towerId not in venues:
+			venues[towerId] = location
+	return venues
+
+# ------------------------------------------------------------------------------- #
+# Scenarios - running totals of several tower or polygon sets over the same       #
+# points; each set is { towerId: (lon, lat) } or a TowerIndex (nearest tower), or #
+# { towerId: Polygon } or a PolygonTree (polygon containing the point); indexes   #
+# are built once and queried block after block                                    #
+# ------------------------------------------------------------------------------- #
+class Scenarios:
+
+	def __init__(self, regionSets):
+		self.indexes = []
+		self.totals = []
+		for regions in regionSets:
+			if not isinstance(regions, (TowerIndex, PolygonTree)):
+				first = next(iter(regions.values()), None)
+				regions = TowerIndex(regions) if isinstance(first, tuple) else PolygonTree(regions)
+			self.indexes.append(regions)
+			self.totals.append(PopulationTotals(regions.towerIds))
+
+	# assigns a block of points under every scenario; the point geometries the
+	# polygon sets are queried with are made once for all of them
+	def add(self, lon, lat, population):
+		points = None
+		for index, totals in zip(self.indexes, self.totals):
+			if isinstance(index, TowerIndex):
+				owner = index.assign(lon, lat)
+			else:
+				if points is None:
+					points = shapely.points(lon, lat)
+				owner = index.assign(lon, lat, points)
+			totals.add(owner, population)
+
+	# [ { towerId: population }, ... ] in the order of the sets
+	def populations(self):
+		return [ totals.populations() for totals in self.totals ]
@@ -0,0 +1,69 @@
+# ------------------------------------------------------------------------------- #
+# sharding.py - Splits the gridded population into fixed size shards that are     #
+#               estimated by a pool of worker processes; partial sums are merged  #
+#               in shard order, so totals do not depend on the number of workers, #
+#               and equal those of a single pass up to float summation order      #
+# ------------------------------------------------------------------------------- #
+
+import multiprocessing, numpy, shapely
+from datetime import datetime
+from .points import load_grid
+from .containment import PopulationTotals, assign_polygons
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+SHARD_POINTS         = 65536 # points per shard; fixed so results don't depend on the number of workers
+# workers are forked: the scripts run at the top level, with no __main__ guard, so a
+# spawned worker would import the script and run all of it again
+FORK_AVAILABLE       = 'fork' in multiprocessing.get_all_start_methods()
+
+# state of a worker process, set once by init_worker
+worker = {}
+
+# ------------------------------------------------------------------------------- #
+# Sets up a worker process                                                        #
+# grid = path of a point file (memory mapped by every worker) or (lon, lat, pop)  #
+# regions = { towerId: Polygon } or a containment.TowerIndex                      #
+# boundary = polygon the points are clipped to (nearest tower assignment only)    #
+# ------------------------------------------------------------------------------- #
+def init_worker(grid, regions, towerIds, boundary):
+	worker['grid'] = load_grid(grid) if isinstance(grid, str) else grid
+	worker['regions'] = regions
+	worker['towerIds'] = towerIds
+	worker['boundary'] = boundary
+
+# ------------------------------------------------------------------------------- #
+# Estimates one shard: points [first, last) of the grid                           #
+# returns PopulationTotals over towerIds                                          #
+# ------------------------------------------------------------------------------- #
+def estimate_shard(shard):
+	first, last = shard
+	lon, lat, population = [numpy.asarray(column[first:last], dtype=numpy.float64) for column in worker['grid']]
+	regions = worker['regions']
+	if isinstance(regions, dict):
+		towerIds, owner, tests = assign_polygons(regions, lon, lat)
+	else:
+		owner = numpy.full(len(lon), -1, dtype=numpy.int64)
+		inside = numpy.ones(len(lon), dtype=bool)
+		if worker['boundary'] is not None and len(lon) > 0:
+			inside = shapely.contains_xy(worker['boundary'], lon, lat)
+		owner[inside] = regions.assign(lon[inside], lat[inside])
+	totals = PopulationTotals(worker['towerIds'])
+	totals.add(owner, population)
+	return totals
+
+# ------------------------------------------------------------------------------- #
+# Estimates the whole grid with a pool of forked workers (FORK_AVAILABLE, not on  #
+# Windows), reporting progress per shard                                          #
+# returns { towerId: population }, in the same order as sum_populations          #
+# ------------------------------------------------------------------------------- #
+def estimate_sharded(grid, points, regions, towerIds, boundary = None, workers = 1, shardPoints = SHARD_POINTS):
+	shards = [(first, min(first + shardPoints, points)) for first in range(0, points, shardPoints)]
+	totals = PopulationTotals(towerIds)
+	startTime = datetime.now()
+	with multiprocessing.get_context('fork').Pool(workers, init_worker, (grid, regions, towerIds, boundary)) as pool:
+		for i, partial in enumerate(pool.imap(estimate_shard, shards)): # in shard order
+			totals.merge(partial)
+			print('Shard ' + str(i + 1) + ' of ' + str(len(shards)) + ' done (' + str(totals.points) + ' points, ' + str(datetime.now() - startTime) + ')')
+	return totals.populations()
@@ -0,0 +1,71 @@
+# ------------------------------------------------------------------------------- #
+# voronoi.py - Voronoi tessellation of the cell towers, clipped to the geometry;  #
+#              replaces tesselation2.html and polygon_processor.rb                #
+# ------------------------------------------------------------------------------- #
+
+import numpy, shapely
+from shapely.geometry import MultiPolygon
+from shapely.geometry.polygon import orient
+from .containment import distinct_towers
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+SENTINEL_DISTANCE    = 10 # how far the sentinel sites are, in spans of the data
+
+# ------------------------------------------------------------------------------- #
+# Computes the Voronoi cell of every tower with Qhull (scipy), in O(n log n);     #
+# four far away sentinel sites close the outer cells, which are then clipped to   #
+# the boundary polygon; a cell the coastline cuts in pieces keeps all of them     #
+# returns { towerId: Polygon or MultiPolygon } for the towers whose cell meets   #
+# the boundary                                                                    #
+# ------------------------------------------------------------------------------- #
+def tessellate(towers, boundary):
+	from scipy.spatial import Voronoi
+	towerIds, coords = distinct_towers(towers)
+	if len(towerIds) == 0:
+		return {}
+	minLon, minLat, maxLon, maxLat = boundary.bounds
+	minLon, minLat = min(minLon, coords[:, 0].min()), min(minLat, coords[:, 1].min())
+	maxLon, maxLat = max(maxLon, coords[:, 0].max()), max(maxLat, coords[:, 1].max())
+	centre = numpy.array([(minLon + maxLon) / 2, (minLat + maxLat) / 2])
+	far = SENTINEL_DISTANCE * max(maxLon - minLon, maxLat - minLat, 1e-6)
+	sentinels = centre + far * numpy.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])
+	diagram = Voronoi(numpy.vstack((coords, sentinels)))
+	regions = [ diagram.regions[r] for r in diagram.point_region[:len(towerIds)].tolist() ]
+	rings = numpy.repeat(numpy.arange(len(regions)), [ len(region) + 1 for region in regions ])
+	vertices = numpy.concatenate([ region + region[:1] for region in regions ])
+	cells = shapely.polygons(shapely.linearrings(diagram.vertices[vertices], indices=rings))
+	shapely.prepare(boundary)
+	clipped = cells.copy()
+	cut = ~shapely.contains_properly(boundary, cells) # only cells crossing the boundary need clipping
+	clipped[cut] = shapely.intersection(cells[cut], boundary)
+	polygons = {}
+	for i in range(len(towerIds)):
+		cell = clipped[i]
+		if cell.geom_type == 'GeometryCollection': # pieces of area only
+			parts = [ part for part in shapely.get_parts(cell) if part.geom_type == 'Polygon' ]
+			cell = MultiPolygon(parts) if len(parts) > 1 else parts[0] if len(parts) == 1 else None
+		if cell is None or cell.is_empty or cell.geom_type not in ('Polygon', 'MultiPolygon'):
+			continue
+		polygons[towerIds[i]] = cell
+	return polygons
+
+# ------------------------------------------------------------------------------- #
+# Writes polygons in the format population_estimator.py reads                     #
+# tower_id, lon, lat (one line per vertex); a cell of more than one ring (pieces #
+# or holes) has every ring closed, outer rings counter-clockwise and holes        #
+# clockwise, as containment.load_polygons expects                                 #
+# ------------------------------------------------------------------------------- #
+def write_polygons(file, polygons):
+	for towerId in polygons:
+		pieces = list(getattr(polygons[towerId], 'geoms', [polygons[towerId]]))
+		if len(pieces) == 1 and len(pieces[0].interiors) == 0:
+			coords = pieces[0].exterior.coords[:-1]
+		else:
+			coords = []
+			for piece in map(orient, pieces):
+				for ring in [piece.exterior] + list(piece.interiors):
+					coords = coords + ring.coords[:]
+		for lon, lat in coords:
+			file.write(str(towerId) + ', ' + repr(lon) + ', ' + repr(lat) + '\n')
@@ -5,21 +5,35 @@
 # Date: 02/01/2014                                                                #
 # ------------------------------------------------------------------------------- #
 
-import datetime, shapely, sys, math
+import datetime, numpy, shapely, sys, math
 from datetime import datetime, date, time
 from shapely.geometry import Polygon, Point
 from math import modf
+from celltowers.ascii_grid import read_header, read_blocks, cell_centres, rasterize, CHUNK_ROWS
+from celltowers.points import PointWriter, NPY_EXTENSION
+from celltowers.containment import load_geometry
+from celltowers.cache import Cache, CACHE_FOLDER
+from celltowers.instrumentation import Metrics
+from celltowers.cli import parse_options, open_files, positive_int, non_empty
 
 def help():
-	print('Use: ' + sys.argv[0] + ' input_file geometry_file output_file')
+	print('Use: ' + sys.argv[0] + ' [--chunk-rows=N] [--cache] [--metrics=FILE] [--profile=DIR] input_file geometry_file output_file')
+	print('  --chunk-rows=N  grid rows parsed at a time (default ' + str(CHUNK_ROWS) + '); bounds peak memory')
+	print('  --cache         keep the converted points and the rasterized geometry in ' + CACHE_FOLDER)
+	print('                  for later runs')
+	print('  --metrics=FILE  append the timings, counts and memory of every stage to FILE (JSON lines)')
+	print('  --profile=DIR   write a cProfile dump of every stage to DIR')
+	print('output_file is written as text (lon,lat,population) unless it ends in ' + NPY_EXTENSION + ', which is binary float64')
 
 # ------------------------------------------------------------------------------- #
 # Some definitions                                                                #
 # ------------------------------------------------------------------------------- #
 FEEDBACK_NUM_RECORDS = 100
+CACHED_BLOCK_POINTS  = 65536 # cached points copied to the output at a time
 NUM_ARGS             = 4
 TOLERANCE            = 0.00001
-ARCGIS_NO_DATA_VALUE = -3.40282346639e+038
+FLAGS                = ['--cache']
+VALUES               = { '--chunk-rows': positive_int, '--metrics': non_empty, '--profile': non_empty }
 
 # ------------------------------------------------------------------------------- #
 # Script begins                                                                   #
@@ -30,79 +44,46 @@ print('Start time: ' + str(startTime.hour) + ':' + str(startTime.minute) + ':' +
 # ------------------------------------------------------------------------------- #
 # Command line validation                                                         #
 # Parameters (required): input_file output_file                                   # 
+# Options: --chunk-rows=N, --cache, --metrics=FILE, --profile=DIR                 #
 # ------------------------------------------------------------------------------- #
+options = parse_options([arg for arg in sys.argv[1:] if arg.startswith('--')], FLAGS, VALUES, help)
+sys.argv = [arg for arg in sys.argv if not arg.startswith('--')]
 if len(sys.argv) != NUM_ARGS:
 	help()
 	exit(1)
+chunkRows = options.get('--chunk-rows', CHUNK_ROWS)
+cache = Cache() if '--cache' in options else None
+metrics = Metrics(sys.argv[0], options.get('--metrics'), options.get('--profile'))
 	
 # ------------------------------------------------------------------------------- #
 # Opening of files                                                                #
 # ------------------------------------------------------------------------------- #
 print('Trying to open the input and geometry files for reading')
-try: 
-	input = open(sys.argv[1], 'rt')
-except:
-	print('Could not open file ' + sys.argv[1])
-	exit(2)
-try: 
-	geometry = open(sys.argv[2], 'rt')
-except:
-	print('Could not open file ' + sys.argv[2])
-	input.close()
-	exit(3)
-try: 
-	output = open(sys.argv[3], 'wt')
-except:
-	print('Could not open file ' + sys.argv[3])
-	input.close()
-	geometry.close()
-	exit(4)
+input, geometry, output = open_files([(sys.argv[1], 'rt'), (sys.argv[2], 'rt'), (sys.argv[3], PointWriter)])
 print('Success!')
 
 # ------------------------------------------------------------------------------- #
 # Reading geometry file                                                           #
 # ------------------------------------------------------------------------------- #
 print('Reading geometry file')
-geoData = []
-for line in geometry:
-	line = line.replace('\n', '')	
-	data = line.split(' ')
-	for i in range(0, len(data)):
-		d = data[i].split(',')
-		geoData.append([float(d[0]), float(d[1])])
+stage = metrics.begin('geometry')
+poly = load_geometry(geometry)
 geometry.close()
+stage.count('vertices', len(poly.exterior.coords) - 1)
+stage.end()
 print('Geometry file looking good :-)')
-#print(geoData)
-
-# ------------------------------------------------------------------------------- #
-# Creating a polygon based on geometry                                            #
-# ------------------------------------------------------------------------------- #
-print('Creating a polygon based on geometry')
-poly = Polygon(geoData)
-print('That was easy!')
 
 # ------------------------------------------------------------------------------- #
 # Reading metadata                                                                #
 # ------------------------------------------------------------------------------- #
 print('Metadata:')
-for i in range(0, 6):
-	line = input.readline()
-	line = line.replace('\n', '')
-	line = " ".join(line.split()) # eliminates duplicate whitespaces
-	data = line.split(' ')
-	#print(data[1])
-	if i == 0:
-		nCols = int(data[1])
-	elif i == 1:
-		nRows = int(data[1])
-	elif i == 2:
-		xllCorner = float(data[1])
-	elif i == 3:
-		yllCorner = float(data[1])
-	elif i == 4:
-		cellSize = float(data[1])
-	else:
-		noDataValue = float(data[1])
+header = read_header(input)
+nCols = header['nCols']
+nRows = header['nRows']
+xllCorner = header['xllCorner']
+yllCorner = header['yllCorner']
+cellSize = header['cellSize']
+noDataValue = header['noDataValue']
 print('\tnCols: \t\t' + str(nCols))
 print('\tRows: \t\t' + str(nRows))
 print('\txllCorner: \t' + str(xllCorner))
@@ -116,49 +97,65 @@ print('\t(' + str(xllCorner) + ',' + str(yllCorner + nRows * cellSize) + ')')
 print('\t(' + str(xllCorner + nCols * cellSize) + ',' + str(yllCorner + nRows * cellSize) + ')')
 
 # ------------------------------------------------------------------------------- #
-# Reading the grid                                                                #
-# ------------------------------------------------------------------------------- #
-grid = [ [ 0. for j in xrange(nCols) ] for i in xrange(nRows) ]
-i = 0
-totalUnbounded = 0
-for line in input:
-	line = line.replace('\n', '')
-	if line[0] == ' ':
-		line = line[1:]
-	data = line.split(' ')
-	for j in xrange(nCols):
-		value = float(data[j])
-		if value == ARCGIS_NO_DATA_VALUE or value == noDataValue or value < 0:
-			continue
-		grid[i][j] = value
-		totalUnbounded = totalUnbounded + value
-	i = i + 1
+# Reading the grid and writing the new file, one block of rows at a time; the    #
+# geometry is rasterized onto each block instead of testing cells one by one     #
+# ------------------------------------------------------------------------------- #
+print('Reading the grid and writing the new file')
+stage = metrics.begin('conversion')
+# the points are cached as a float64 .npy file, streamed in as they are converted
+# and back out in blocks, next to a small entry with the totals
+converted = None
+if cache is not None:
+	layout = (nCols, nRows, xllCorner, yllCorner, cellSize)
+	key = cache.key('converted', [sys.argv[1], sys.argv[2]], (chunkRows,) + layout)
+	converted = cache.get(key)
+	cachedPoints = cache.file(key)
+if converted is not None and cachedPoints is not None:
+	print('Using the cached points')
+	totalUnbounded, totalBounded = converted
+	points = numpy.load(cachedPoints, mmap_mode='r')
+	for first in range(0, len(points), CACHED_BLOCK_POINTS):
+		block = points[first:first + CACHED_BLOCK_POINTS]
+		output.write(block[:, 0], block[:, 1], block[:, 2])
+	stage.count('points', len(points))
+else:
+	if cache is not None: # the rasterized geometry only depends on the geometry and the grid layout
+		mask = cache.cached('mask', [sys.argv[2]], layout, lambda: numpy.concatenate([ numpy.packbits(rasterize(poly, header, r, min(chunkRows, nRows - r)), axis=1) for r in range(0, nRows, chunkRows) ]))
+		temporary = cache.temporary()
+		cached = PointWriter(temporary, binary=True, rounded=False)
+	totalUnbounded = 0
+	totalBounded = 0
+	for firstRow, block in read_blocks(input, header, chunkRows):
+		totalUnbounded = totalUnbounded + block.sum(dtype=numpy.float64)
+		if cache is not None:
+			inside = (block != 0) & numpy.unpackbits(mask[firstRow:firstRow + len(block)], axis=1, count=nCols).astype(bool)
+		else:
+			inside = (block != 0) & rasterize(poly, header, firstRow, len(block))
+		rows, cols = numpy.nonzero(inside)
+		totalBounded = totalBounded + block[inside].sum(dtype=numpy.float64)
+		lons, lats = cell_centres(header, firstRow, len(block))
+		output.write(lons[cols], lats[rows], block[inside])
+		stage.count('rows', len(block))
+		stage.count('cells', block.size)
+		stage.count('points', len(cols))
+		stage.progress('rows', firstRow + len(block), nRows, FEEDBACK_NUM_RECORDS)
+		if cache is not None:
+			cached.write(lons[cols], lats[rows], block[inside])
+	if cache is not None:
+		cached.close()
+		cache.add_file(key, temporary)
+		cache.put(key, (totalUnbounded, totalBounded))
 input.close()
-print('Total unbounded: ' + str(totalUnbounded))
-
-# ------------------------------------------------------------------------------- #
-# Writing the new file                                                            #
-# ------------------------------------------------------------------------------- #
-print('Writing the new file')
-totalBounded = 0
-for i in xrange(nRows):
-	#print('Line ' + str(i+1) + ' of ' + str(nRows))
-	lat = yllCorner + (nRows - i) * cellSize + cellSize/2 # cellSize/2 to have values centered instead of top-left
-	for j in xrange(nCols):
-		if grid[i][j] == 0:
-			continue
-		lon = xllCorner + j * cellSize + cellSize/2 # cellSize/2 to have values centered instead of top-left
-		point = Point(lon, lat)
-		if point.within(poly):		
-			totalBounded = totalBounded + grid[i][j]
-			output.write(str.format('{0:.5f}', lon) + ',' + str.format('{0:.5f}', lat) + ',' + str.format('{0:.2f}', grid[i][j]) + '\n')
 output.close()
+stage.end()
+print('Total unbounded: ' + str(totalUnbounded))
 print('Total bounded: ' + str(totalBounded))
-		
+
 # ------------------------------------------------------------------------------- #
 # Script ends                                                                     #
 # ------------------------------------------------------------------------------- #
 endTime = datetime.now()
 print('End time: ' + str(endTime.hour) + ':' + str(endTime.minute) + ':' + str(endTime.second)) 
 elapsedTime = endTime - startTime
-print('Elapsed time: ' + str(elapsedTime))
\ No newline at end of file
+print('Elapsed time: ' + str(elapsedTime))
+metrics.close()
\ No newline at end of file
@@ -10,14 +10,35 @@ from datetime import datetime, date, time
 from shapely.geometry import Polygon, Point
 from collections import defaultdict
 from math import modf
+from celltowers.points import load_grid, NPY_EXTENSION
+from celltowers.sharding import estimate_sharded, SHARD_POINTS, FORK_AVAILABLE
+from celltowers.cache import Cache, CACHE_FOLDER
+from celltowers.instrumentation import Metrics
+from celltowers.containment import PolygonIndex, TowerIndex, load_towers, load_polygons, load_geometry
+from celltowers.estimation import Estimator
+from celltowers.cli import parse_options, open_files, positive_int, positive_float, non_empty
 
 def help():
-  print('Usage: ' + sys.argv[0] + ' polygon_file geometry_file grid_population_file output_file')
+  print('Usage: ' + sys.argv[0] + ' [--batch | --nearest | --fractional[=SIZE]] [--workers=N] [--cache] [--metrics=FILE] [--profile=DIR] polygon_file geometry_file grid_population_file output_file')
+  print('  --batch    load the grid into numpy arrays and test each polygon against all of its points at once')
+  print('  --nearest  polygon_file is a tower file (CSV or TSV); each point goes to its nearest tower')
+  print('  --fractional[=SIZE]  share each grid cell (a square of SIZE degrees, by default the grid spacing)')
+  print('             among the polygons it overlaps, in proportion to the overlapping area')
+  print('  --workers=N  split the grid into shards of ' + str(SHARD_POINTS) + ' points estimated by N processes (default or batch')
+  print('             polygon mode, or nearest; not with --fractional; needs fork, so not on Windows)')
+  print('  --cache    keep the parsed grid, polygons and tower index in ' + CACHE_FOLDER + ' for later runs')
+  print('  --metrics=FILE  append the timings, counts and memory of every stage to FILE (JSON lines)')
+  print('  --profile=DIR   write a cProfile dump of every stage to DIR')
+  print('grid_population_file is either text (lon,lat,population) or a ' + NPY_EXTENSION + ' file from grid_converter.py')
 
 # ------------------------------------------------------------------------------- #
 # Some definitions                                                                #
 # ------------------------------------------------------------------------------- #
 NUM_ARGS             = 5
+FLAGS                = ['--batch', '--nearest', '--fractional', '--cache']
+MODES                = ['--batch', '--nearest', '--fractional'] # at most one of them
+VALUES               = { '--workers': positive_int, '--fractional': positive_float, '--metrics': non_empty, '--profile': non_empty }
+FEEDBACK_NUM_RECORDS = 100000 # points between progress lines of the point by point estimation
 
 # ------------------------------------------------------------------------------- #
 # Script begins                                                                   #
@@ -28,109 +49,148 @@ print('Start time: ' + str(startTime.hour) + ':' + str(startTime.minute) + ':' +
 # ------------------------------------------------------------------------------- #
 # Command line validation                                                         #
 # Parameters (required): input_file output_file                                   #
-# ------------------------------------------------------------------------------- #
-if len(sys.argv) != NUM_ARGS:
+# Options: --batch, --nearest, --fractional[=SIZE], --workers=N, --cache,         #
+#          --metrics=FILE, --profile=DIR                                          #
+# ------------------------------------------------------------------------------- #
+options = parse_options([arg for arg in sys.argv[1:] if arg.startswith('--')], FLAGS, VALUES, help)
+sys.argv = [arg for arg in sys.argv if not arg.startswith('--')]
+workers = options.get('--workers', 0)
+fractional = options.get('--fractional')
+if fractional is True: # no SIZE, the grid spacing
+  fractional = 0.
+metricsFile = options.get('--metrics')
+profileFolder = options.get('--profile')
+modes = [mode for mode in MODES if mode in options]
+if len(sys.argv) != NUM_ARGS or len(modes) > 1 or (fractional is not None and workers > 0):
   help()
   exit(1)
+if workers > 0 and not FORK_AVAILABLE:
+  print('--workers needs processes started by fork, which this platform does not have')
+  exit(1)
+cache = Cache() if '--cache' in options else None
+metrics = Metrics(sys.argv[0], metricsFile, profileFolder)
 
 # ------------------------------------------------------------------------------- #
 # Opening of files                                                                #
 # ------------------------------------------------------------------------------- #
 print('Trying to open the polygon and geometry files for reading')
-try:
-  input = open(sys.argv[1], 'rt')
-except:
-  print('Could not open file ' + sys.argv[1])
-  exit(2)
-try:
-  geometry = open(sys.argv[2], 'rt')
-except:
-  print('Could not open file ' + sys.argv[2])
-  input.close()
-  exit(3)
-try:
-  populations = open(sys.argv[3], 'rt')
-except:
-  print('Could not open file ' + sys.argv[3])
-  input.close()
-  exit(4)
-try:
-  output = open(sys.argv[4], 'wt')
-except:
-  print('Could not open file ' + sys.argv[3])
-  input.close()
-  geometry.close()
-  exit(5)
+binary = sys.argv[3].lower().endswith(NPY_EXTENSION) # .npy files are memory mapped from their path
+input, geometry, populations, output = open_files([(sys.argv[1], 'rt'), (sys.argv[2], 'rt'), (sys.argv[3], 'rb' if binary else 'rt'), (sys.argv[4], 'wt')])
 print('Success!')
 
 # ------------------------------------------------------------------------------- #
 # Reading geometry file                                                           #
 # ------------------------------------------------------------------------------- #
 print('Reading geometry file')
-geoData = []
-for line in geometry:
-  line = line.strip()
-  data = line.split(' ')
-  for i in range(0, len(data)):
-    d = data[i].split(',')
-    geoData.append([float(d[0]), float(d[1])])
+stage = metrics.begin('geometry')
+poly = load_geometry(geometry)
 geometry.close()
+stage.count('vertices', len(poly.exterior.coords) - 1)
+stage.end()
 print('Geometry file looking good :-)')
-#print(geoData)
-
-# ------------------------------------------------------------------------------- #
-# Creating a polygon based on geometry                                            #
-# ------------------------------------------------------------------------------- #
-print('Creating a polygon based on geometry')
-poly = Polygon(geoData)
-print('That was easy!')
 
 # ------------------------------------------------------------------------------- #
 # Load populations into array                                                     #
 # ------------------------------------------------------------------------------- #
 print('Reading gridded populations')
-populationData = {} # map of x,y tuple to number
-for line in populations:
-  line = line.strip()
-  data = line.split(',')
-  populationData[(float(data[0]), float(data[1]))] = float(data[2])
+stage = metrics.begin('grid')
+vectorized = '--batch' in options or '--nearest' in options or workers > 0 or fractional is not None
+if cache is not None and not binary: # .npy files are mapped, not parsed
+  lon, lat, population = cache.cached('points', [sys.argv[3]], (), lambda: load_grid(populations))
+elif binary:
+  lon, lat, population = load_grid(sys.argv[3])
+elif vectorized:
+  lon, lat, population = load_grid(populations)
+else:
+  populationData = {} # map of x,y tuple to number
+  for line in populations:
+    line = line.strip()
+    data = line.split(',')
+    populationData[(float(data[0]), float(data[1]))] = float(data[2])
+if not vectorized and (cache is not None or binary):
+  populationData = dict(zip(zip(lon.tolist(), lat.tolist()), population.tolist()))
 populations.close();
+if vectorized:
+  estimator = Estimator((lon, lat, population), poly)
+stage.count('points', len(lon) if vectorized or binary or cache is not None else len(populationData))
+stage.end()
 print('Finished loading gridded populations')
 
 # ------------------------------------------------------------------------------- #
 # Load polygons into array                                                        #
 # ------------------------------------------------------------------------------- #
-print('Reading polygons')
-voronoiPolygons = {} # map of cell tower id to polygon
-for line in input:
-  line = line.strip()
-  data = line.split(',')
-  voronoiPolygons.setdefault(int(data[0]),[]).append([float(data[1]), float(data[2])])
-for k in voronoiPolygons:
-  poly = Polygon(voronoiPolygons[k])
-  voronoiPolygons[k] = poly
-print('Finished reading polygons')
+if '--nearest' in options:
+  print('Reading towers')
+  stage = metrics.begin('towers')
+  if cache is not None:
+    index = cache.cached('towers', [sys.argv[1]], (), lambda: TowerIndex(load_towers(input)))
+  else:
+    index = TowerIndex(load_towers(input))
+  stage.count('towers', len(index.towerIds))
+  print(str(len(index.towerIds)) + ' tower locations read')
+else:
+  print('Reading polygons')
+  stage = metrics.begin('polygons')
+  if cache is not None:
+    voronoiPolygons = cache.cached('polygons', [sys.argv[1]], (), lambda: load_polygons(input))
+  else:
+    voronoiPolygons = load_polygons(input) # map of cell tower id to polygon
+  stage.count('polygons', len(voronoiPolygons))
+  print('Finished reading polygons')
+input.close()
+stage.end()
 
 # ------------------------------------------------------------------------------- #
 # Estimate populations                                                            #
 # ------------------------------------------------------------------------------- #
 print('Estimating...')
-estimatedPopulations = defaultdict(int) # map of cell tower id to number, defaultdict ensures values default to 0
-for coord in populationData:
-    for towerid in voronoiPolygons: # if we aren't deleting used items as we go along, this for loop should be the innermost one, for efficiency
-        popAtCoord = populationData[coord]
-        point = Point(coord[0], coord[1])
-        if point.within(voronoiPolygons[towerid]):
-            estimatedPopulations[towerid] += popAtCoord
-        #    del populationData[coord] # we can delete this popData entry since it will not appear again
+stage = metrics.begin('estimation')
+if fractional is not None:
+  estimatedPopulations = estimator.estimate(voronoiPolygons, fractional)
+  print('Cell size: ' + str(estimator.stats['cellSize']))
+  print('Boundary cells clipped: ' + str(estimator.stats['clipped']) + ' of ' + str(len(lon)))
+  stage.count('points', len(lon))
+  stage.count('clipped', estimator.stats['clipped'])
+elif workers > 0:
+  print('Using ' + str(workers) + ' workers')
+  grid = sys.argv[3] if binary else (lon, lat, population) # workers map .npy files themselves
+  if '--nearest' in options:
+    estimatedPopulations = estimate_sharded(grid, len(lon), index, index.towerIds, poly, workers)
+  else:
+    estimatedPopulations = estimate_sharded(grid, len(lon), voronoiPolygons, list(voronoiPolygons), None, workers)
+  stage.count('points', len(lon))
+elif '--nearest' in options:
+  estimatedPopulations = estimator.estimate(index)
+  print('Points outside the geometry: ' + str(estimator.stats['outside']))
+  stage.count('points', len(lon))
+elif '--batch' in options:
+  estimatedPopulations = estimator.estimate(voronoiPolygons)
+  print('Containment tests: ' + str(estimator.stats['tests']) + ' (' + str(len(lon) * len(voronoiPolygons)) + ' without pruning)')
+  stage.count('points', len(lon))
+  stage.count('tests', estimator.stats['tests'])
+else:
+  index = PolygonIndex(voronoiPolygons)
+  estimatedPopulations = defaultdict(int) # map of cell tower id to number, defaultdict ensures values default to 0
+  for i, coord in enumerate(populationData):
+    stage.progress('points', i + 1, len(populationData), FEEDBACK_NUM_RECORDS)
+    towerid = index.locate(coord[0], coord[1]) # Voronoi polygons don't overlap, so the first hit is the only one
+    if towerid is not None:
+      estimatedPopulations[towerid] += populationData[coord]
+  print('Containment tests: ' + str(index.tests) + ' (' + str(len(populationData) * len(voronoiPolygons)) + ' without the index)')
+  stage.count('points', len(populationData))
+  stage.count('tests', index.tests)
+stage.end()
 
 # ------------------------------------------------------------------------------- #
 # Writing the new file                                                            #
 # ------------------------------------------------------------------------------- #
 print('Writing the new file')
+stage = metrics.begin('output')
 for towerid in estimatedPopulations:
     output.write(str.format('{0:.0f}', towerid) + ',' + str.format('{0:.2f}', estimatedPopulations[towerid]) + '\n')
 output.close()
+stage.count('towers', len(estimatedPopulations))
+stage.end()
 print('Finished!')
 
 # ------------------------------------------------------------------------------- #
@@ -140,3 +200,4 @@ endTime = datetime.now()
 print('End time: ' + str(endTime.hour) + ':' + str(endTime.minute) + ':' + str(endTime.second))
 elapsedTime = endTime - startTime
 print('Elapsed time: ' + str(elapsedTime))
+metrics.close()
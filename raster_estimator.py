@@ -0,0 +1,149 @@
+# ------------------------------------------------------------------------------- #
+# raster_estimator.py - Estimates populations per cell tower straight from the    #
+#                       gridded population map, in a single pass: row blocks of   #
+#                       the .asc file are masked to the geometry, assigned to     #
+#                       towers and summed, with no intermediate point file        #
+# tower_id, population                                                            #
+# ------------------------------------------------------------------------------- #
+
+import datetime, sys
+from datetime import datetime, date, time
+from celltowers.ascii_grid import read_header, CHUNK_ROWS
+from celltowers.containment import TowerIndex, PolygonTree, PopulationTotals, load_towers, load_polygons, load_geometry, allocate_fractional
+from celltowers.scenarios import masked_blocks, ASC_EXTENSION
+from celltowers.cli import parse_options, open_files, positive_int, non_empty
+from celltowers.instrumentation import Metrics
+
+def help():
+	print('Use: ' + sys.argv[0] + ' [--polygons [--fractional]] [--chunk-rows=N] [--metrics=FILE] [--profile=DIR] grid_file geometry_file tower_file output_file')
+	print('  --polygons      tower_file is a Voronoi polygon file; points are tested against the polygons')
+	print('                  instead of going to their nearest tower')
+	print('  --fractional    share each grid cell among the polygons it overlaps, in proportion to the')
+	print('                  overlapping area')
+	print('  --chunk-rows=N  grid rows processed at a time (default ' + str(CHUNK_ROWS) + '); bounds peak memory')
+	print('  --metrics=FILE  append the timings, counts and memory of every stage to FILE (JSON lines)')
+	print('  --profile=DIR   write a cProfile dump of every stage to DIR')
+	print('grid_file is an ' + ASC_EXTENSION + ' grid')
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+NUM_ARGS             = 5
+FLAGS                = ['--polygons', '--fractional']
+VALUES               = { '--chunk-rows': positive_int, '--metrics': non_empty, '--profile': non_empty }
+FEEDBACK_NUM_RECORDS = 100 # grid rows between progress lines
+
+# ------------------------------------------------------------------------------- #
+# Script begins                                                                   #
+# ------------------------------------------------------------------------------- #
+startTime = datetime.now()
+print('Start time: ' + str(startTime.hour) + ':' + str(startTime.minute) + ':' + str(startTime.second))
+
+# ------------------------------------------------------------------------------- #
+# Command line validation                                                         #
+# Parameters (required): grid_file geometry_file tower_file output_file           #
+# Options: --polygons, --fractional, --chunk-rows=N, --metrics=FILE,              #
+#          --profile=DIR                                                          #
+# ------------------------------------------------------------------------------- #
+options = parse_options([arg for arg in sys.argv[1:] if arg.startswith('--')], FLAGS, VALUES, help)
+sys.argv = [arg for arg in sys.argv if not arg.startswith('--')]
+usePolygons = '--polygons' in options
+fractional = '--fractional' in options
+chunkRows = options.get('--chunk-rows', CHUNK_ROWS)
+if len(sys.argv) != NUM_ARGS or (fractional and not usePolygons) or not sys.argv[1].lower().endswith(ASC_EXTENSION):
+	help()
+	exit(1)
+metrics = Metrics(sys.argv[0], options.get('--metrics'), options.get('--profile'))
+
+# ------------------------------------------------------------------------------- #
+# Opening of files                                                                #
+# ------------------------------------------------------------------------------- #
+print('Trying to open the grid, geometry and tower files for reading')
+input, geometry, towerFile, output = open_files([(sys.argv[1], 'rt'), (sys.argv[2], 'rt'), (sys.argv[3], 'rt'), (sys.argv[4], 'wt')])
+print('Success!')
+
+# ------------------------------------------------------------------------------- #
+# Reading geometry, towers (or polygons) and grid metadata                        #
+# ------------------------------------------------------------------------------- #
+print('Reading geometry file')
+stage = metrics.begin('geometry')
+poly = load_geometry(geometry)
+geometry.close()
+stage.count('vertices', len(poly.exterior.coords) - 1)
+stage.end()
+if usePolygons:
+	print('Reading polygons')
+	stage = metrics.begin('polygons')
+	voronoiPolygons = load_polygons(towerFile) # map of cell tower id to polygon
+	tree = PolygonTree(voronoiPolygons) # built once, queried block after block
+	towerIds = tree.towerIds
+	stage.count('polygons', len(towerIds))
+	print(str(len(voronoiPolygons)) + ' polygons read')
+else:
+	print('Reading towers')
+	stage = metrics.begin('towers')
+	index = TowerIndex(load_towers(towerFile))
+	towerIds = index.towerIds
+	stage.count('towers', len(towerIds))
+	print(str(len(towerIds)) + ' tower locations read')
+towerFile.close()
+stage.end()
+header = read_header(input)
+input.close()
+print('Grid: ' + str(header['nCols']) + ' x ' + str(header['nRows']) + ' cells of ' + str(header['cellSize']))
+
+# ------------------------------------------------------------------------------- #
+# Estimating, one block of rows at a time                                         #
+# ------------------------------------------------------------------------------- #
+print('Estimating...')
+stage = metrics.begin('estimation')
+totals = PopulationTotals(towerIds)
+totalBounded = 0
+clipped = 0
+rowsRead = 0
+for cells, lon, lat, population in masked_blocks(sys.argv[1], poly, chunkRows):
+	if fractional:
+		blockTotals, blockClipped = allocate_fractional(tree, lon, lat, population, header['cellSize'])
+		totals.merge(blockTotals)
+		clipped = clipped + blockClipped
+	else:
+		if usePolygons:
+			owner = tree.assign(lon, lat)
+		else:
+			owner = index.assign(lon, lat)
+		totals.add(owner, population)
+	totalBounded = totalBounded + population.sum()
+	rows = cells // header['nCols']
+	rowsRead = rowsRead + rows
+	stage.count('rows', rows)
+	stage.count('points', len(lon))
+	stage.progress('rows', rowsRead, header['nRows'], FEEDBACK_NUM_RECORDS)
+estimatedPopulations = totals.populations()
+if fractional:
+	stage.count('clipped', clipped)
+stage.end()
+print('Total bounded: ' + str(totalBounded))
+print('Total assigned: ' + str(sum(estimatedPopulations.values())))
+if fractional:
+	print('Boundary cells clipped: ' + str(clipped))
+
+# ------------------------------------------------------------------------------- #
+# Writing the new file                                                            #
+# ------------------------------------------------------------------------------- #
+print('Writing the new file')
+stage = metrics.begin('output')
+for towerid in estimatedPopulations:
+	output.write(str.format('{0:.0f}', towerid) + ',' + str.format('{0:.2f}', estimatedPopulations[towerid]) + '\n')
+output.close()
+stage.count('towers', len(estimatedPopulations))
+stage.end()
+print('Finished!')
+
+# ------------------------------------------------------------------------------- #
+# Script ends                                                                     #
+# ------------------------------------------------------------------------------- #
+endTime = datetime.now()
+print('End time: ' + str(endTime.hour) + ':' + str(endTime.minute) + ':' + str(endTime.second))
+elapsedTime = endTime - startTime
+print('Elapsed time: ' + str(elapsedTime))
+metrics.close()
@@ -0,0 +1,122 @@
+# ------------------------------------------------------------------------------- #
+# reestimate.py - Estimates populations per cell tower (nearest tower), keeping   #
+#                 the assignment in a state file; later runs with an updated      #
+#                 tower file only reassign the points around the towers that were #
+#                 added, moved or removed                                         #
+# tower_id, population                                                            #
+# ------------------------------------------------------------------------------- #
+
+import datetime, os, sys
+from datetime import datetime, date, time
+from celltowers.points import load_grid, NPY_EXTENSION
+from celltowers.containment import load_towers, load_geometry
+from celltowers.incremental import build_state, load_state, save_state, update, estimated_populations
+from celltowers.cli import parse_options, open_files, non_empty
+from celltowers.instrumentation import Metrics
+
+def help():
+	print('Use: ' + sys.argv[0] + ' [--metrics=FILE] [--profile=DIR] state_file tower_file geometry_file grid_population_file output_file')
+	print('state_file (.npz) is created by the first run and updated by the following ones; the grid and')
+	print('geometry must stay the same between runs')
+	print('  --metrics=FILE  append the timings, counts and memory of every stage to FILE (JSON lines)')
+	print('  --profile=DIR   write a cProfile dump of every stage to DIR')
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+NUM_ARGS             = 6
+VALUES               = { '--metrics': non_empty, '--profile': non_empty }
+
+# ------------------------------------------------------------------------------- #
+# Script begins                                                                   #
+# ------------------------------------------------------------------------------- #
+startTime = datetime.now()
+print('Start time: ' + str(startTime.hour) + ':' + str(startTime.minute) + ':' + str(startTime.second))
+
+# ------------------------------------------------------------------------------- #
+# Command line validation                                                         #
+# Parameters (required): state_file tower_file geometry_file                      #
+#                        grid_population_file output_file                         #
+# Options: --metrics=FILE, --profile=DIR                                          #
+# ------------------------------------------------------------------------------- #
+options = parse_options([arg for arg in sys.argv[1:] if arg.startswith('--')], [], VALUES, help)
+sys.argv = [arg for arg in sys.argv if not arg.startswith('--')]
+if len(sys.argv) != NUM_ARGS:
+	help()
+	exit(1)
+metrics = Metrics(sys.argv[0], options.get('--metrics'), options.get('--profile'))
+statePath = sys.argv[1]
+
+# ------------------------------------------------------------------------------- #
+# Opening of files                                                                #
+# ------------------------------------------------------------------------------- #
+print('Trying to open the tower, geometry and population files for reading')
+binary = sys.argv[4].lower().endswith(NPY_EXTENSION) # .npy files are memory mapped from their path
+input, geometry, populations, output = open_files([(sys.argv[2], 'rt'), (sys.argv[3], 'rt'), (sys.argv[4], 'rb' if binary else 'rt'), (sys.argv[5], 'wt')])
+print('Success!')
+
+# ------------------------------------------------------------------------------- #
+# Reading towers, geometry and gridded populations                                #
+# ------------------------------------------------------------------------------- #
+print('Reading towers')
+stage = metrics.begin('towers')
+towers = load_towers(input)
+input.close()
+stage.count('towers', len(towers))
+stage.end()
+print(str(len(towers)) + ' towers read')
+stage = metrics.begin('geometry')
+poly = load_geometry(geometry)
+geometry.close()
+stage.count('vertices', len(poly.exterior.coords) - 1)
+stage.end()
+print('Reading gridded populations')
+stage = metrics.begin('grid')
+lon, lat, population = load_grid(sys.argv[4] if binary else populations)
+populations.close()
+stage.count('points', len(lon))
+stage.end()
+
+# ------------------------------------------------------------------------------- #
+# Estimating: from scratch the first time, incrementally afterwards               #
+# ------------------------------------------------------------------------------- #
+stage = metrics.begin('estimation')
+if os.path.exists(statePath):
+	print('Updating ' + statePath)
+	state = load_state(statePath)
+	if len(state['owner']) != len(lon):
+		print('The state file was built from a different grid (' + str(len(state['owner'])) + ' points)')
+		output.close()
+		exit(6)
+	added, removed, moved, reassigned = update(state, towers, lon, lat, population)
+	print('Towers added: ' + str(added) + ', removed: ' + str(removed) + ', moved: ' + str(moved))
+	print('Points reassigned: ' + str(reassigned))
+	stage.count('reassigned', reassigned)
+else:
+	print('No state file yet, estimating from scratch')
+	state = build_state(towers, lon, lat, population, poly)
+	stage.count('points', len(lon))
+save_state(statePath, state)
+stage.end()
+
+# ------------------------------------------------------------------------------- #
+# Writing the new file                                                            #
+# ------------------------------------------------------------------------------- #
+print('Writing the new file')
+stage = metrics.begin('output')
+estimatedPopulations = estimated_populations(state)
+for towerid in estimatedPopulations:
+	output.write(str.format('{0:.0f}', towerid) + ',' + str.format('{0:.2f}', estimatedPopulations[towerid]) + '\n')
+output.close()
+stage.count('towers', len(estimatedPopulations))
+stage.end()
+print('Finished!')
+
+# ------------------------------------------------------------------------------- #
+# Script ends                                                                     #
+# ------------------------------------------------------------------------------- #
+endTime = datetime.now()
+print('End time: ' + str(endTime.hour) + ':' + str(endTime.minute) + ':' + str(endTime.second))
+elapsedTime = endTime - startTime
+print('Elapsed time: ' + str(elapsedTime))
+metrics.close()
@@ -0,0 +1,141 @@
+# ------------------------------------------------------------------------------- #
+# scenario_estimator.py - Estimates populations for many tower or polygon sets    #
+#                         (scenarios) in a single pass over the gridded           #
+#                         population, writing one output file per scenario        #
+# tower_id, population                                                            #
+# ------------------------------------------------------------------------------- #
+
+import datetime, os, sys
+from datetime import datetime, date, time
+from celltowers.ascii_grid import CHUNK_ROWS
+from celltowers.containment import load_towers, load_polygons, load_geometry
+from celltowers.scenarios import Scenarios, masked_blocks, clustered_towers
+from celltowers.instrumentation import Metrics
+from celltowers.cli import parse_options, positive_int, non_empty
+
+def help():
+	print('Use: ' + sys.argv[0] + ' [--chunk-rows=N] [--metrics=FILE] [--profile=DIR] grid_file geometry_file output_folder scenario [scenario ...]')
+	print('  scenario is one of')
+	print('    towers:FILE         every point goes to its nearest tower of FILE (CSV or TSV)')
+	print('    polygons:FILE       every point goes to the polygon of FILE that contains it')
+	print('    clusters:FILE:KM    towers of FILE clustered by DBSCAN with eps KM; each cluster is a')
+	print('                        single venue at its centroid')
+	print('  output_folder gets one NAME.csv per scenario, NAME being the file name of the scenario,')
+	print('  followed by -KM for clusters')
+	print('  grid_file is an .asc grid (streamed --chunk-rows rows at a time, default ' + str(CHUNK_ROWS) + ')')
+	print('  or a point file from grid_converter.py (text or .npy)')
+	print('  --metrics=FILE  append the timings, counts and memory of every stage to FILE (JSON lines)')
+	print('  --profile=DIR   write a cProfile dump of every stage to DIR')
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+MIN_ARGS             = 5
+SCENARIO_KINDS       = ['towers', 'polygons', 'clusters']
+VALUES               = { '--chunk-rows': positive_int, '--metrics': non_empty, '--profile': non_empty }
+
+# ------------------------------------------------------------------------------- #
+# Script begins                                                                   #
+# ------------------------------------------------------------------------------- #
+startTime = datetime.now()
+print('Start time: ' + str(startTime.hour) + ':' + str(startTime.minute) + ':' + str(startTime.second))
+
+# ------------------------------------------------------------------------------- #
+# Command line validation                                                         #
+# Parameters (required): grid_file geometry_file output_folder scenario ...       #
+# Options: --chunk-rows=N, --metrics=FILE, --profile=DIR                          #
+# ------------------------------------------------------------------------------- #
+options = parse_options([arg for arg in sys.argv[1:] if arg.startswith('--')], [], VALUES, help)
+sys.argv = [arg for arg in sys.argv if not arg.startswith('--')]
+if len(sys.argv) < MIN_ARGS:
+	help()
+	exit(1)
+scenarios = [] # (kind, file, eps)
+for arg in sys.argv[4:]:
+	kind, _, file = arg.partition(':') # paths can hold ':' (Windows drives), so only the kind and KM are split off
+	if kind == 'clusters':
+		file, _, eps = file.rpartition(':')
+	if kind == 'clusters' and file != '' and eps.replace('.', '', 1).isdigit() and float(eps) > 0:
+		scenarios.append((kind, file, float(eps)))
+	elif kind in SCENARIO_KINDS and kind != 'clusters' and file != '':
+		scenarios.append((kind, file, None))
+	else:
+		help()
+		exit(1)
+chunkRows = options.get('--chunk-rows', CHUNK_ROWS)
+metrics = Metrics(sys.argv[0], options.get('--metrics'), options.get('--profile'))
+
+# ------------------------------------------------------------------------------- #
+# Reading geometry and scenarios                                                  #
+# ------------------------------------------------------------------------------- #
+print('Reading geometry file')
+try:
+	poly = load_geometry(sys.argv[2])
+except OSError:
+	print('Could not open file ' + sys.argv[2])
+	exit(3)
+print('Reading ' + str(len(scenarios)) + ' scenarios')
+stage = metrics.begin('scenarios')
+regionSets = []
+names = []
+for kind, file, eps in scenarios:
+	try:
+		regions = load_polygons(file) if kind == 'polygons' else load_towers(file)
+	except OSError:
+		print('Could not open file ' + file)
+		exit(4)
+	name = os.path.splitext(os.path.basename(file))[0]
+	if kind == 'clusters':
+		regions = clustered_towers(regions, eps)
+		name = name + '-' + str(eps)
+	while name in names: # the same file twice
+		name = name + '_'
+	print('  ' + name + ': ' + str(len(regions)) + ' ' + ('polygons' if kind == 'polygons' else 'towers'))
+	regionSets.append(regions)
+	names.append(name)
+estimates = Scenarios(regionSets)
+stage.count('scenarios', len(scenarios))
+stage.end()
+if not os.path.isdir(sys.argv[3]):
+	os.makedirs(sys.argv[3])
+
+# ------------------------------------------------------------------------------- #
+# Estimating, one block of the grid at a time for all the scenarios               #
+# ------------------------------------------------------------------------------- #
+print('Estimating...')
+stage = metrics.begin('estimation')
+totalBounded = 0
+try:
+	for _, lon, lat, population in masked_blocks(sys.argv[1], poly, chunkRows):
+		estimates.add(lon, lat, population)
+		totalBounded = totalBounded + population.sum()
+		stage.count('points', len(lon))
+except OSError:
+	print('Could not open file ' + sys.argv[1])
+	exit(2)
+stage.end()
+print('Total bounded: ' + str(totalBounded))
+
+# ------------------------------------------------------------------------------- #
+# Writing one file per scenario                                                   #
+# ------------------------------------------------------------------------------- #
+print('Writing the new files')
+stage = metrics.begin('output')
+for name, estimatedPopulations in zip(names, estimates.populations()):
+	output = open(os.path.join(sys.argv[3], name + '.csv'), 'wt')
+	for towerid in estimatedPopulations:
+		output.write(str.format('{0:.0f}', towerid) + ',' + str.format('{0:.2f}', estimatedPopulations[towerid]) + '\n')
+	output.close()
+	print('  ' + name + '.csv: ' + str(len(estimatedPopulations)) + ' towers, ' + str(sum(estimatedPopulations.values())) + ' assigned')
+stage.count('scenarios', len(names))
+stage.end()
+print('Finished!')
+
+# ------------------------------------------------------------------------------- #
+# Script ends                                                                     #
+# ------------------------------------------------------------------------------- #
+endTime = datetime.now()
+print('End time: ' + str(endTime.hour) + ':' + str(endTime.minute) + ':' + str(endTime.second))
+elapsedTime = endTime - startTime
+print('Elapsed time: ' + str(elapsedTime))
+metrics.close()
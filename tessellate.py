@@ -0,0 +1,96 @@
+# ------------------------------------------------------------------------------- #
+# tessellate.py - Computes the Voronoi polygons of the cell towers, clipped to    #
+#                 the geometry, in the format population_estimator.py reads       #
+# tower_id, lon, lat                                                              #
+# ------------------------------------------------------------------------------- #
+
+import datetime, sys
+from datetime import datetime, date, time
+from celltowers.containment import load_towers, load_geometry
+from celltowers.voronoi import tessellate, write_polygons
+from celltowers.cli import parse_options, open_files, non_empty
+from celltowers.instrumentation import Metrics
+
+def help():
+	print('Use: ' + sys.argv[0] + ' [--metrics=FILE] [--profile=DIR] tower_file geometry_file output_file')
+	print('tower_file is either CSV (*_towers.csv) or TSV (ANT_POS.TSV)')
+	print('  --metrics=FILE  append the timings, counts and memory of every stage to FILE (JSON lines)')
+	print('  --profile=DIR   write a cProfile dump of every stage to DIR')
+
+# ------------------------------------------------------------------------------- #
+# Some definitions                                                                #
+# ------------------------------------------------------------------------------- #
+NUM_ARGS             = 4
+VALUES               = { '--metrics': non_empty, '--profile': non_empty }
+
+# ------------------------------------------------------------------------------- #
+# Script begins                                                                   #
+# ------------------------------------------------------------------------------- #
+startTime = datetime.now()
+print('Start time: ' + str(startTime.hour) + ':' + str(startTime.minute) + ':' + str(startTime.second))
+
+# ------------------------------------------------------------------------------- #
+# Command line validation                                                         #
+# Parameters (required): tower_file geometry_file output_file                     #
+# Options: --metrics=FILE, --profile=DIR                                          #
+# ------------------------------------------------------------------------------- #
+options = parse_options([arg for arg in sys.argv[1:] if arg.startswith('--')], [], VALUES, help)
+sys.argv = [arg for arg in sys.argv if not arg.startswith('--')]
+if len(sys.argv) != NUM_ARGS:
+	help()
+	exit(1)
+metrics = Metrics(sys.argv[0], options.get('--metrics'), options.get('--profile'))
+
+# ------------------------------------------------------------------------------- #
+# Opening of files                                                                #
+# ------------------------------------------------------------------------------- #
+print('Trying to open the tower and geometry files for reading')
+input, geometry, output = open_files([(sys.argv[1], 'rt'), (sys.argv[2], 'rt'), (sys.argv[3], 'wt')])
+print('Success!')
+
+# ------------------------------------------------------------------------------- #
+# Reading towers and geometry                                                     #
+# ------------------------------------------------------------------------------- #
+print('Reading towers')
+stage = metrics.begin('towers')
+towers = load_towers(input)
+input.close()
+stage.count('towers', len(towers))
+stage.end()
+print(str(len(towers)) + ' towers read')
+print('Reading geometry file')
+stage = metrics.begin('geometry')
+poly = load_geometry(geometry)
+geometry.close()
+stage.count('vertices', len(poly.exterior.coords) - 1)
+stage.end()
+
+# ------------------------------------------------------------------------------- #
+# Tessellating                                                                    #
+# ------------------------------------------------------------------------------- #
+print('Tessellating...')
+stage = metrics.begin('tessellation')
+polygons = tessellate(towers, poly)
+stage.count('towers', len(towers))
+stage.end()
+print(str(len(polygons)) + ' polygons inside the geometry')
+
+# ------------------------------------------------------------------------------- #
+# Writing the new file                                                            #
+# ------------------------------------------------------------------------------- #
+print('Writing the new file')
+stage = metrics.begin('output')
+write_polygons(output, polygons)
+output.close()
+stage.count('polygons', len(polygons))
+stage.end()
+print('Finished!')
+
+# ------------------------------------------------------------------------------- #
+# Script ends                                                                     #
+# ------------------------------------------------------------------------------- #
+endTime = datetime.now()
+print('End time: ' + str(endTime.hour) + ':' + str(endTime.minute) + ':' + str(endTime.second))
+elapsedTime = endTime - startTime
+print('Elapsed time: ' + str(elapsedTime))
+metrics.close()